@@ -0,0 +1,174 @@
+''' Offline throughput benchmarks of the frontier, the scraper and whole
+workers, against benchmarks.cache_server instead of the live cache server.
+
+    python -m benchmarks.bench_crawl all --pages 2000
+    python -m benchmarks.bench_crawl worker --pages 2000 --latency 0.02 --threads 8
+
+Each benchmark runs in a fresh process, so module level crawl state does
+not leak between them, with its save files in a temporary directory. It
+reports pages/sec, CPU seconds per page and how much the resident memory
+grew. Runs with the same arguments crawl the same synthetic corpus.
+'''
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from multiprocessing import get_context
+
+from benchmarks.cache_server import add_arguments, make_corpus, make_server
+from utils.config import Config
+from utils.download import decode_response
+
+BENCHMARKS = ("frontier", "scraper", "worker")
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "config.ini")
+
+
+def rss_mib():
+    # current resident set size, from /proc where available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_config(args, save_dir, seed_urls):
+    cparser = ConfigParser()
+    cparser.read(CONFIG_FILE)
+    cparser["CRAWLER"]["SEEDURL"] = ",".join(seed_urls)
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    properties = cparser["LOCAL PROPERTIES"]
+    properties["SAVE"] = os.path.join(save_dir, "frontier.shelve")
+    properties["THREADCOUNT"] = str(args.threads)
+    properties["WORKERMODEL"] = args.worker_model
+    properties["PARSEPROCESSES"] = str(args.parse_processes)
+    properties["METRICSFILE"] = os.path.join(save_dir, "metrics.json")
+    return Config(cparser)
+
+
+class Measurement(object):
+    ''' Wall time, CPU time and memory growth of a block. '''
+
+    def __enter__(self):
+        self.rss = rss_mib()
+        self.cpu = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+        self.cpu = time.process_time() - self.cpu
+        self.rss = rss_mib() - self.rss
+
+    def report(self, name, pages):
+        pages = max(pages, 1)
+        print(f"{name:<10} {pages:8d} pages {self.elapsed:8.2f}s "
+              f"{pages / self.elapsed:10.1f} pages/s "
+              f"{self.cpu / pages * 1000:8.3f} ms CPU/page "
+              f"{self.rss:+8.1f} MiB")
+
+
+def bench_frontier(args, config, corpus):
+    ''' Adding every url of the corpus, then handing them out and
+    completing them, without downloads. '''
+    from crawler.frontier import Frontier
+    with Measurement() as measurement:
+        frontier = Frontier(config, True)
+        for url in corpus.urls:
+            frontier.add_url(url)
+        pages = 0
+        while True:
+            url = frontier.get_tbd_url()
+            if not url:
+                break
+            frontier.mark_url_complete(url)
+            frontier.task_done(url)
+            pages += 1
+        frontier.close()
+    measurement.report("frontier", pages)
+
+
+def bench_scraper(args, config, corpus):
+    ''' scraper.scraper over every page of the corpus, decoded beforehand. '''
+    import scraper
+    server = make_server(args, corpus, 0)
+    responses = [
+        decode_response(url, *server.reply_for(url)) for url in corpus.urls]
+    server.server_close()
+    if config.parse_processes:
+        scraper.start_parse_pool(config.parse_processes)
+    with Measurement() as measurement:
+        for resp in responses:
+            scraper.scraper(resp.url, resp)
+    scraper.stop_parse_pool()
+    measurement.report("scraper", len(responses))
+
+
+def serve(args, port):
+    make_server(args, make_corpus(args), port).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_worker(args, config, corpus):
+    ''' A whole crawl by config.threads_count workers, against a stand-in
+    cache server in another process so its CPU time is not counted. '''
+    from crawler import Crawler
+    from utils.metrics import metrics
+    port = free_port()
+    server = get_context("spawn").Process(
+        target=serve, args=(args, port), daemon=True)
+    server.start()
+    config.cache_server = ("127.0.0.1", port)
+    for _ in range(100):
+        try:
+            socket.create_connection(config.cache_server, 1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    if config.worker_model == "async":
+        from crawler.async_worker import AsyncWorker
+        crawler = Crawler(config, True, worker_factory=AsyncWorker)
+    else:
+        crawler = Crawler(config, True)
+    with Measurement() as measurement:
+        crawler.start()
+    server.terminate()
+    pages = sum(count for name, count in metrics.counters.items()
+                if name.startswith("status."))
+    measurement.report("worker", pages)
+
+
+def run(args):
+    corpus = make_corpus(args)
+    with tempfile.TemporaryDirectory() as save_dir:
+        config = make_config(args, save_dir, corpus.seed_urls)
+        globals()[f"bench_{args.benchmark}"](args, config, corpus)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("benchmark", choices=BENCHMARKS + ("all",))
+    add_arguments(parser)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--worker_model", type=str, default="thread")
+    parser.add_argument("--parse_processes", type=int, default=0)
+    parser.add_argument("--politeness", type=float, default=0.0)
+    args = parser.parse_args()
+    if args.benchmark == "all":
+        for benchmark in BENCHMARKS:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_crawl", benchmark]
+                + sys.argv[2:], check=True)
+    else:
+        run(args)
@@ -0,0 +1,106 @@
+''' Compares the streaming extraction path of scraper.parse_page with the
+BeautifulSoup path it replaced, over a corpus of saved html pages.
+
+    python -m benchmarks.bench_extract path/to/pages [more paths ...]
+
+Paths may be files or directories, which are searched recursively for
+*.htm and *.html files. Reports pages/sec and MB/sec of the html -> text
+and links step alone and of the whole parse, and checks that both paths
+produce the same words and links.
+'''
+import os
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from urllib.parse import urlparse, urlunparse, urljoin
+
+from bs4 import BeautifulSoup
+
+import scraper
+from utils.extract import extract, extract_bs4
+from utils.tokenizer import words as tokenize_words
+
+BASE_URL = "https://www.ics.uci.edu/"
+
+
+def legacy_parse(base_url, content):
+    ''' The scraper's BeautifulSoup based parse, returning its words and
+    links the same way parse_page does. Words come from the scraper's own
+    tokenizer rather than nltk, so only the extraction is compared. '''
+    soup = BeautifulSoup(content, 'html.parser')
+    words = tokenize_words(
+        soup.get_text(), scraper.min_word_len, scraper.stop_words)
+    text_ratio = len(soup.get_text(strip=True)) / len(content)
+    links = []
+    for link in soup.find_all(['a', 'link']):
+        if link.name == 'a':
+            href = link.get('href')
+        elif link.name == 'link':
+            href = link.get('href')
+            rel = link.get('rel')
+            if rel and 'stylesheet' not in rel:
+                continue
+        if href:
+            parsed_href = urlparse(href)
+            cleaned_href = urlunparse(parsed_href._replace(fragment=''))
+            absolute_url = urljoin(base_url, cleaned_href)
+            parsed_absolute_url = urlparse(absolute_url)
+            cleaned_absolute_url = parsed_absolute_url._replace(query='').geturl()
+            if scraper.is_valid(cleaned_absolute_url):
+                links.append(cleaned_absolute_url)
+    return Counter(words), text_ratio, links
+
+
+def find_pages(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if name.endswith((".htm", ".html")):
+                    yield os.path.join(root, name)
+
+
+def timed(label, func, pages):
+    start = time.perf_counter()
+    results = [func(content) for content in pages]
+    elapsed = time.perf_counter() - start
+    size = sum(len(content) for content in pages) / 2 ** 20
+    print(f"{label:<28} {elapsed:8.3f}s {len(pages) / elapsed:10.1f} pages/s "
+          f"{size / elapsed:8.2f} MB/s")
+    return results
+
+
+def main(paths, repeat):
+    pages = [open(path, "rb").read() for path in find_pages(paths)]
+    pages = [page for page in pages if 0 < len(page) <= scraper.max_page_size]
+    if not pages:
+        raise SystemExit("No pages found.")
+    print(f"{len(pages)} pages, "
+          f"{sum(len(page) for page in pages) / 2 ** 20:.1f} MB, x{repeat}")
+    pages = pages * repeat
+
+    timed("extract, BeautifulSoup", extract_bs4, pages)
+    timed("extract, streaming", extract, pages)
+    legacy = timed("parse, BeautifulSoup",
+                   lambda content: legacy_parse(BASE_URL, content), pages)
+    streaming = timed("parse, streaming",
+                      lambda content: scraper.parse_page(
+                          BASE_URL, BASE_URL, content), pages)
+
+    mismatches = 0
+    for (words, text_ratio, links), record in zip(legacy, streaming):
+        if (words != record.word_counts
+                or abs(text_ratio - record.text_ratio) > 1e-9
+                or links != [link for link, _ in record.links]):
+            mismatches += 1
+    print(f"{mismatches} of {len(pages)} pages differ between the two paths")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    main(args.paths, args.repeat)
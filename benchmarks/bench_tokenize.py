@@ -0,0 +1,102 @@
+''' Compares the scraper's bundled tokenizer with the nltk path it replaced:
+the time to import scraper and nltk, and words/sec over the text of saved
+pages or of a synthetic corpus.
+
+    python -m benchmarks.bench_tokenize path/to/pages [more paths ...]
+    python -m benchmarks.bench_tokenize --pages 2000
+
+Paths are searched like in benchmarks.bench_extract. The nltk path needs the
+punkt tokenizer data to be installed already, nothing is downloaded. Also
+reports how many words the two paths count differently.
+'''
+import sys
+import time
+import subprocess
+from argparse import ArgumentParser
+from collections import Counter
+
+from benchmarks.bench_extract import find_pages
+from benchmarks.cache_server import SyntheticCorpus
+from utils.extract import extract
+from utils.tokenizer import STOP_WORDS, words, words_many
+
+MIN_WORD_LEN = 2
+
+
+def import_time(statement, repeat):
+    ''' Fastest wall time of running statement in a fresh interpreter, minus
+    that of an empty one. '''
+    def run(code):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+    return run(statement) - run("pass")
+
+
+def nltk_words(word_tokenize, text):
+    return [word.lower() for word in word_tokenize(text)
+            if len(word) >= MIN_WORD_LEN and word.isalpha()
+            and word.lower() not in STOP_WORDS]
+
+
+def timed(label, func, texts):
+    start = time.perf_counter()
+    results = func(texts)
+    elapsed = time.perf_counter() - start
+    count = sum(len(result) for result in results)
+    print(f"{label:<28} {elapsed:8.3f}s {count / elapsed:12.0f} words/s "
+          f"{len(texts) / elapsed:10.1f} pages/s")
+    return results
+
+
+def main(args):
+    print(f"{'import scraper':<28} "
+          f"{import_time('import scraper', args.repeat):8.3f}s")
+    elapsed = import_time(
+        "import nltk; from nltk.corpus import stopwords; "
+        "stopwords.words('english')", args.repeat)
+    print(f"{'import nltk and stopwords':<28} {elapsed:8.3f}s")
+
+    if args.paths:
+        pages = [open(path, "rb").read() for path in find_pages(args.paths)]
+    else:
+        corpus = SyntheticCorpus(args.pages)
+        pages = [corpus.page(url) for url in corpus.urls]
+    texts = [extract(page)[0] for page in pages if page]
+    if not texts:
+        raise SystemExit("No pages found.")
+    print(f"{len(texts)} pages, "
+          f"{sum(len(text) for text in texts) / 2 ** 20:.1f} MB of text")
+
+    bundled = timed("bundled, per page", lambda texts: [
+        words(text, MIN_WORD_LEN) for text in texts], texts)
+    timed("bundled, batch", lambda texts: words_many(
+        texts, MIN_WORD_LEN), texts)
+    import nltk
+    try:
+        nltk.word_tokenize("Probe.")
+    except LookupError:
+        print("nltk's punkt data is not installed, skipping the nltk path")
+        return
+    legacy = timed("nltk", lambda texts: [
+        nltk_words(nltk.word_tokenize, text) for text in texts], texts)
+    differ = total = 0
+    for ours, theirs in zip(bundled, legacy):
+        ours, theirs = Counter(ours), Counter(theirs)
+        differ += sum(((ours - theirs) + (theirs - ours)).values())
+        total += sum(theirs.values())
+    print(f"{differ} of {total} words counted differently")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--pages", type=int, default=1000,
+                        help="synthetic pages, when no paths are given")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="interpreter starts per import timing")
+    main(parser.parse_args())
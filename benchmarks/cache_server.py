@@ -0,0 +1,228 @@
+''' A local stand-in for the spacetime cache server, for benchmarks and
+offline runs.
+
+    python -m benchmarks.cache_server --port 8765 --pages 5000 --latency 0.05
+    python launch.py --cache_server 127.0.0.1:8765
+
+It answers GET /?q=<url>&u=<user agent> with the same CBOR payload as the
+cache server, {"url", "status", "response": pickled requests.Response},
+from a corpus that is either synthetic (--pages) or recorded (--corpus, a
+directory laid out as <host>/<path>, with index.html standing for a
+directory). Every robots.txt allows everything. Replies are delayed by
+--latency +- --jitter seconds, a fraction --error_rate of urls answer with
+an error status and a fraction --fail_rate of requests fail at the cache
+server itself.
+'''
+import os
+import time
+import pickle
+import random
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+# hosts of the synthetic corpus, all inside the crawled domains
+SYNTHETIC_HOSTS = (
+    "www.ics.uci.edu", "vision.ics.uci.edu", "ngs.ics.uci.edu",
+    "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu")
+ROBOTS_TXT = b"User-agent: *\nDisallow:\n"
+# statuses of pages that --error_rate turns into errors
+ERROR_STATUSES = (404, 500, 503)
+
+
+class SyntheticCorpus(object):
+    ''' A deterministic web of pages spread over SYNTHETIC_HOSTS.
+
+    Page i links to page i + 1, so every page is reachable from page 0, and
+    to links_per_page other pages. Text and paths are drawn from a seeded
+    random vocabulary, so pages are neither exact nor near duplicates of
+    each other.
+    '''
+
+    def __init__(self, pages=1000, links_per_page=10, words_per_page=300,
+                 seed=0):
+        self.pages = pages
+        self.links_per_page = links_per_page
+        self.words_per_page = words_per_page
+        self.seed = seed
+        rng = random.Random(seed)
+        self.vocabulary = [
+            "".join(rng.choice("abcdefghijklmnopqrstuvwxyz")
+                    for _ in range(rng.randint(3, 10)))
+            for _ in range(5000)]
+        self.urls = [self._make_url(page_id) for page_id in range(pages)]
+        self.ids = {url: page_id for page_id, url in enumerate(self.urls)}
+
+    def _make_url(self, page_id):
+        rng = random.Random(f"{self.seed}-url-{page_id}")
+        host = SYNTHETIC_HOSTS[page_id % len(SYNTHETIC_HOSTS)]
+        words = rng.sample(self.vocabulary, 3)
+        return f"https://{host}/{words[0]}/{words[1]}-{words[2]}/{page_id:x}"
+
+    @property
+    def seed_urls(self):
+        return self.urls[:1]
+
+    def page(self, url):
+        ''' Returns the html of url, or None if it is not in the corpus. '''
+        page_id = self.ids.get(url.rstrip("/"))
+        if page_id is None:
+            return None
+        rng = random.Random(f"{self.seed}-page-{page_id}")
+        links = {(page_id + 1) % self.pages}
+        links.update(rng.randrange(self.pages)
+                     for _ in range(self.links_per_page))
+        text = " ".join(rng.choice(self.vocabulary)
+                        for _ in range(self.words_per_page))
+        anchors = "".join(
+            f'<li><a href="{self.urls[link]}">{rng.choice(self.vocabulary)}</a></li>'
+            for link in sorted(links))
+        return (f"<html><head><title>page {page_id}</title></head><body>"
+                f"<p>{text}</p><ul>{anchors}</ul></body></html>").encode("utf-8")
+
+
+class RecordedCorpus(object):
+    ''' Pages saved under root as <host>/<path>. '''
+
+    def __init__(self, root):
+        self.root = root
+
+    @property
+    def seed_urls(self):
+        return [f"https://{host}/" for host in sorted(os.listdir(self.root))]
+
+    @property
+    def urls(self):
+        urls = []
+        for host in sorted(os.listdir(self.root)):
+            for directory, _, files in os.walk(os.path.join(self.root, host)):
+                path = os.path.relpath(directory, os.path.join(self.root, host))
+                path = "" if path == "." else path.replace(os.sep, "/") + "/"
+                for name in sorted(files):
+                    name = "" if name == "index.html" else name
+                    urls.append(f"https://{host}/{path}{name}")
+        return urls
+
+    def page(self, url):
+        parsed = urlparse(url)
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(
+            os.path.join(root, parsed.netloc, parsed.path.lstrip("/")))
+        # only serve files inside the corpus
+        if os.path.commonpath([root, path]) != root:
+            return None
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def make_payload(url, status, content=None):
+    ''' CBOR reply of the cache server for url. '''
+    payload = {"url": url, "status": status}
+    if content is not None:
+        resp = requests.models.Response()
+        resp.status_code = status
+        resp.url = url
+        resp._content = content
+        resp.headers["Content-Type"] = "text/html"
+        payload["response"] = pickle.dumps(resp)
+    else:
+        payload["error"] = f"Stand-in cache server: status {status} for {url}"
+    return cbor.dumps(payload)
+
+
+class StandInCacheServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, corpus, host="127.0.0.1", port=8765, latency=0.0,
+                 jitter=0.0, error_rate=0.0, fail_rate=0.0, seed=0):
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.fail_rate = fail_rate
+        self.seed = seed
+        self.rng = random.Random(seed)
+        super().__init__((host, port), CacheRequestHandler)
+
+    def reply_for(self, url):
+        ''' Returns (http status, body) of the reply for url. '''
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            return 502, b""
+        if urlparse(url).path == "/robots.txt":
+            return 200, make_payload(url, 200, ROBOTS_TXT)
+        # errors are a property of the url, so repeated runs agree
+        url_rng = random.Random(f"{self.seed}-{url}")
+        if self.error_rate and url_rng.random() < self.error_rate:
+            return 200, make_payload(url, url_rng.choice(ERROR_STATUSES))
+        content = self.corpus.page(url)
+        if content is None:
+            return 200, make_payload(url, 404)
+        return 200, make_payload(url, 200, content)
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        url = query.get("q", [""])[0]
+        server = self.server
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, server.latency + server.rng.uniform(
+                -server.jitter, server.jitter)))
+        status, body = server.reply_for(url)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_arguments(parser):
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--links_per_page", type=int, default=10)
+    parser.add_argument("--corpus", type=str, default=None,
+                        help="directory of recorded pages, instead of --pages")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--fail_rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def make_corpus(args):
+    if args.corpus:
+        return RecordedCorpus(args.corpus)
+    return SyntheticCorpus(args.pages, args.links_per_page, seed=args.seed)
+
+
+def make_server(args, corpus, port):
+    return StandInCacheServer(
+        corpus, port=port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, fail_rate=args.fail_rate, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    corpus = make_corpus(args)
+    server = make_server(args, corpus, args.port)
+    print(f"Serving on 127.0.0.1:{args.port}, seed urls: "
+          f"{','.join(corpus.seed_urls)}")
+    server.serve_forever()
@@ -1,20 +1,29 @@
+import scraper
 from utils import get_logger
+from utils.log import configure_logging
+from utils.metrics import MetricsExporter
 from crawler.frontier import Frontier
 from crawler.worker import Worker
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
+        configure_logging(config)
         self.logger = get_logger("CRAWLER")
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
+        self.metrics_exporter = None
 
     # def register_callback(self, callback):
     #     """Register a callback function."""
     #     self.callbacks.append(callback)
 
     def start_async(self):
+        self.metrics_exporter = MetricsExporter(self.config)
+        self.metrics_exporter.start()
+        if self.config.parse_processes:
+            scraper.start_parse_pool(self.config.parse_processes)
         self.workers = [
             self.worker_factory(worker_id, self.config, self.frontier)
             for worker_id in range(self.config.threads_count)]
@@ -28,6 +37,13 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        scraper.stop_parse_pool()
+        if hasattr(self.frontier, "close"):
+            self.frontier.close()
+        # the report is kept up to date while crawling, log it once at the end
+        scraper.generate_report()
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
 
     def trigger_callbacks(self):
         """Trigger all registered callback functions."""
@@ -0,0 +1,83 @@
+import time
+import asyncio
+
+import aiohttp
+
+from crawler.worker import Worker
+from utils.metrics import metrics
+from utils.async_download import AsyncDownloader
+
+
+class AsyncWorker(Worker):
+    ''' Worker that keeps many downloads in flight on one event loop.
+
+    One dispatcher takes urls from the frontier and starts a task per url,
+    with at most config.async_concurrency tasks at a time. Downloads go
+    through a pooled AsyncDownloader. The blocking parts, robots.txt lookups
+    and scraping, run on the event loop's default thread pool.
+    '''
+
+    def run(self):
+        asyncio.run(self.crawl())
+        self.logger.info(f"Number of domains crawled: {len(self.frontier.robots)}")
+        self.logger.info("Frontier is empty. Stopping Crawler.")
+
+    async def crawl(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.config.async_concurrency)
+        tasks = set()
+        async with AsyncDownloader(self.config) as downloader:
+            while True:
+                await slots.acquire()
+                # get_tbd_url blocks until a host is ready, keep it off the loop
+                tbd_url = await loop.run_in_executor(
+                    None, self.frontier.get_tbd_url)
+                if not tbd_url:
+                    break
+                task = asyncio.create_task(
+                    self.process_async(downloader, tbd_url))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: slots.release())
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def process_async(self, downloader, tbd_url):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            # a page stored by an earlier run is not downloaded again
+            resp = await loop.run_in_executor(
+                None, self.stored_response, tbd_url)
+            if resp is None:
+                domain = self.get_domain(tbd_url)
+                allowed = await loop.run_in_executor(
+                    None, self.check_robots, domain, tbd_url)
+                if not allowed:
+                    return
+                resp = await self.download_once_async(downloader, tbd_url)
+                await loop.run_in_executor(
+                    None, self.store_response, tbd_url, resp)
+            await loop.run_in_executor(
+                None, self.handle_response, tbd_url, resp)
+        except Exception as e:
+            self.logger.error(
+                f"Failed to process {tbd_url}: {e}", extra={"url": tbd_url})
+        finally:
+            self.frontier.task_done(tbd_url)
+            # tasks overlap, so a worker's utilization here is its average
+            # number of urls in flight
+            busy = time.perf_counter() - start
+            metrics.observe("process", busy)
+            metrics.add_busy(self.worker_id, busy)
+
+    async def download_once_async(self, downloader, url):
+        start = time.perf_counter()
+        try:
+            return await downloader.download(url, self.logger)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.warning(
+                f"Download of {url} failed: {e!r}", extra={"url": url})
+            return e
+        finally:
+            metrics.observe("download", time.perf_counter() - start)
@@ -1,73 +1,410 @@
 import os
-import shelve
+import time
+import heapq
 
-from threading import Thread, RLock
+from collections import Counter
+from threading import Thread, RLock, Condition, Event
 from queue import Queue, Empty
+from urllib.parse import urlparse
 
 from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from scraper import is_valid, page_fingerprints, analytics, trap_detector
+from crawler.persistence import SaveWriter, shelve_files
+from crawler.robots import RobotsCache
+from crawler.retry import RetryState
+from crawler.snapshot import FrontierSnapshot, write_snapshot
+from crawler.page_store import PageStore
+from crawler.priority import HostQueues, load_scorer
+from utils.metrics import metrics
+from utils.seen import SeenUrls, CompletedIndex
+from utils.word_counts import make_word_counts
 
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        # One priority queue of urls per host, best score first, and a heap
+        # of (next allowed fetch time, host) for hosts with queued urls.
+        # Hosts whose time has come wait in a heap of (-best score, host),
+        # so the best url of any ready host goes first.
+        self.queues = HostQueues(
+            f"{self.config.save_file}.queue", self.config.host_queue_memory)
+        self.ready_heap = list()
+        self.ready_hosts = list()
+        self.next_fetch = dict()
+        self.scorer = load_scorer(self.config.priority)
+        # Heap of (time, url, score, depth) of failed urls waiting for their
+        # next attempt.
+        self.retry_heap = list()
+        # Number of urls handed out by get_tbd_url that workers have not
+        # finished yet, and url -> (score, depth) of each of them.
+        self.in_progress = 0
+        self.handed_out = dict()
+        # (url, score, depth) of urls being added, until they are queued
+        self.adding = Counter()
+        # Set once the pending urls of a snapshot are all queued.
+        self.loaded = Event()
+        self.loaded.set()
+        self.lock = RLock()
+        self.host_ready = Condition(self.lock)
 
-        if not os.path.exists(self.config.save_file) and not restart:
+        save_files = shelve_files(self.config.save_file)
+        if not save_files and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif save_files and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            for path in save_files:
+                os.remove(path)
+        fresh = restart or not save_files
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        # Only the writer thread touches it once the crawl is running.
+        self.writer = SaveWriter(
+            self.config.save_file, restart,
+            checkpoint_size=self.config.checkpoint_size,
+            checkpoint_interval=self.config.checkpoint_interval)
+        # Hashes of every url ever added: a Bloom filter in front of the
+        # save file, and of every completed url, which the snapshot keeps.
+        self.completed = CompletedIndex()
+        self.seen = SeenUrls(
+            self.writer, self.config.seen_capacity,
+            self.config.seen_error_rate, self.completed)
+        # Content fingerprints and robots.txt rules are kept next to the
+        # save file.
+        page_fingerprints.open(f"{self.config.save_file}.fingerprints", fresh)
+        self.robots = RobotsCache(
+            self.config, f"{self.config.save_file}.robots", fresh)
+        # Report data is checkpointed together with the save file, and
+        # journaled per page in between.
+        replayed = analytics.open(
+            f"{self.config.save_file}.analytics", fresh,
+            make_word_counts(self.config, f"{self.config.save_file}.words"))
+        if replayed:
+            self.logger.info(f"Replayed {replayed} journaled report pages.")
+        self.writer.checkpoint_callbacks.append(analytics.save)
+        trap_detector.open(
+            f"{self.config.save_file}.traps", fresh, self.config)
+        self.writer.checkpoint_callbacks.append(trap_detector.save)
+        # Retry attempts and host circuit breakers, permanently failed urls
+        # are listed in <SAVE>.failed.
+        self.retries = RetryState(
+            self.config, f"{self.config.save_file}.retries",
+            f"{self.config.save_file}.failed", fresh)
+        self.writer.checkpoint_callbacks.append(self.retries.save)
+        # Downloaded pages. Kept on restart, they are the crawled web rather
+        # than crawl progress, and stored urls are never downloaded again.
+        self.page_store = None
+        if self.config.page_store:
+            self.page_store = PageStore(
+                self.config.page_store, self.config.page_store_segment_size)
+        # Pending urls, seen and completed hashes, written at every
+        # checkpoint so a restart does not have to read the whole save file.
+        self.snapshot_file = f"{self.config.save_file}.snapshot"
+        if fresh and os.path.exists(self.snapshot_file):
+            os.remove(self.snapshot_file)
+        if self.config.snapshot:
+            self.writer.checkpoint_callbacks.append(self.save_snapshot)
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
             # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
+            snapshot = (FrontierSnapshot.open(self.snapshot_file)
+                        if self.config.snapshot else None)
+            if snapshot is None or not self._load_snapshot(snapshot):
+                self._parse_save_file()
+            if not self.seen:
                 for url in self.config.seed_urls:
                     self.add_url(url)
+        self.writer.start()
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
+        total_count = 0
         tbd_count = 0
-        for url, completed in self.save.values():
+        for urlhash, (url, completed) in self.writer.load():
+            self.seen.load(urlhash)
+            if completed:
+                self.completed.add(urlhash)
+            total_count += 1
             if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
+                self._restore(url)
                 tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
+    def _restore(self, url, score=None, depth=0):
+        # queues a url that was pending when the crawler stopped, scored
+        # like a seed if its score was not saved
+        if score is None:
+            score = self._score(url, depth, None)
+        retry_at = self.retries.retry_time(url)
+        if retry_at is None:
+            self._enqueue(url, score, depth)
+        else:
+            self._schedule_retry(url, retry_at, score, depth)
+
+    def _load_snapshot(self, snapshot):
+        ''' Restores the frontier from a snapshot and the records replayed
+        from the journal since. Returns False if the snapshot does not fit
+        the configured Bloom filter. '''
+        with metrics.timer("snapshot_load"):
+            if not self.seen.restore(snapshot.bloom_bits(), snapshot.bloom_count):
+                self.logger.info(
+                    f"Snapshot {self.snapshot_file} has a Bloom filter of "
+                    f"another size, reading the save file instead.")
+                return False
+            self.completed.base = snapshot.completed()
+            # The journal may be newer than the snapshot: its records win.
+            replayed = self.writer.replayed
+            journaled = set()
+            for urlhash, (url, completed) in replayed.items():
+                if urlhash not in self.seen.bloom:
+                    self.seen.load(urlhash)
+                if completed:
+                    self.completed.add(urlhash)
+                elif is_valid(url):
+                    self._restore(url)
+                journaled.add(url)
+            self.writer.replayed = dict()
+        self.logger.info(
+            f"Loading {snapshot.pending_count} urls to be downloaded from "
+            f"snapshot of {time.ctime(snapshot.written_at)}, "
+            f"{len(replayed)} journaled since, "
+            f"{snapshot.bloom_count} total urls discovered.")
+        if self.config.snapshot_lazy:
+            # Workers start on the hosts loaded first. Counting the loader as
+            # a url in progress keeps them from stopping before it is done.
+            self.loaded.clear()
+            self.in_progress += 1
+            Thread(target=self._load_pending, args=(snapshot, journaled),
+                   daemon=True).start()
+        else:
+            self._load_pending(snapshot, journaled)
+        return True
+
+    def _load_pending(self, snapshot, journaled):
+        start = time.perf_counter()
+        loaded = 0
+        for host, delay, urls in snapshot.hosts():
+            with self.host_ready:
+                if delay:
+                    self.next_fetch[host] = time.monotonic() + delay
+                for score, depth, url in urls:
+                    if url not in journaled and is_valid(url):
+                        self._restore(url, score, depth)
+                        loaded += 1
+        self.logger.info(
+            f"Loaded {loaded} urls to be downloaded from the snapshot in "
+            f"{time.perf_counter() - start:.2f}s.")
+        if not self.loaded.is_set():
+            self.loaded.set()
+            self.task_done(None)
+
+    def save_snapshot(self):
+        ''' Writes the pending urls, the Bloom filter and the completed
+        hashes to the snapshot file. Called after every checkpoint. '''
+        # A snapshot taken while one is still being loaded would miss urls.
+        self.loaded.wait()
+        with metrics.timer("snapshot"):
+            # Queues first, then hashes: a url added or completed in between
+            # is in the journal, which wins over the snapshot on restart.
+            # Only copies are made under the lock, the spilled urls are read
+            # after releasing it.
+            with self.host_ready:
+                now = time.monotonic()
+                queues, spilled = self.queues.dump()
+                # urls in flight, waiting for a retry or being added are
+                # pending as well
+                unqueued = [(url, score, depth) for url, (score, depth)
+                            in self.handed_out.items()]
+                unqueued.extend(
+                    (url, score, depth)
+                    for _, url, score, depth in self.retry_heap)
+                unqueued.extend(self.adding)
+                delays = {host: next_fetch - now
+                          for host, next_fetch in self.next_fetch.items()
+                          if next_fetch > now}
+            for host, score, depth, url in spilled:
+                queues[host].append((score, depth, url))
+            with self.seen.lock:
+                bloom = self.seen.bloom
+                bits, count = bytes(bloom.bits), bloom.count
+            completed = self.completed.merge()
+            # a url being added may turn out to be queued already
+            queued = {url for urls in queues.values() for _, _, url in urls}
+            for url, score, depth in unqueued:
+                if url not in queued and get_urlhash(url) not in self.completed:
+                    queued.add(url)
+                    queues.setdefault(urlparse(url).netloc, list()).append(
+                        (score, depth, url))
+            hosts = [(host, delays.get(host, 0), urls)
+                     for host, urls in queues.items()]
+            write_snapshot(self.snapshot_file, bits, bloom.num_hashes, count,
+                           completed, hosts)
+
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        ''' Returns the best scored url among the hosts that may be fetched
+        now, waiting for the earliest host to become ready if necessary.
+
+        Returns None only when nothing is queued, no failed url waits for
+        a retry and no worker is still processing a url, since those
+        workers may add more urls. '''
+        with self.host_ready:
+            while True:
+                now = time.monotonic()
+                while self.retry_heap and self.retry_heap[0][0] <= now:
+                    _, url, score, depth = heapq.heappop(self.retry_heap)
+                    self._enqueue(url, score, depth)
+                wake_time = self.retry_heap[0][0] if self.retry_heap else None
+                while self.ready_heap and self.ready_heap[0][0] <= now:
+                    _, host = heapq.heappop(self.ready_heap)
+                    heapq.heappush(
+                        self.ready_hosts, (-self.queues.best(host), host))
+                if not self.ready_hosts:
+                    if not self.ready_heap:
+                        if not self.in_progress and wake_time is None:
+                            return None
+                        self.host_ready.wait(
+                            None if wake_time is None else wake_time - now)
+                        continue
+                    ready_time = self.ready_heap[0][0]
+                    if wake_time is not None:
+                        ready_time = min(ready_time, wake_time)
+                    self.host_ready.wait(ready_time - now)
+                    continue
+                _, host = heapq.heappop(self.ready_hosts)
+                if self.next_fetch.get(host, 0) > now:
+                    # the host's circuit breaker opened since it was ready
+                    heapq.heappush(
+                        self.ready_heap, (self.next_fetch[host], host))
+                    continue
+                score, depth, url = self.queues.pop(host)
+                # stored pages are not downloaded, so no politeness delay
+                if self.page_store is None or url not in self.page_store:
+                    self.next_fetch[host] = now + self.get_delay(host)
+                if host in self.queues:
+                    heapq.heappush(
+                        self.ready_heap, (self.next_fetch.get(host, 0), host))
+                self.in_progress += 1
+                self.handed_out[url] = (score, depth)
+                return url
+
+    def task_done(self, url):
+        ''' Called by a worker once it is done with a url from get_tbd_url,
+        whether or not the download succeeded. '''
+        with self.host_ready:
+            self.in_progress -= 1
+            self.handed_out.pop(url, None)
+            if not self.in_progress and not self.queues:
+                # Wake idle workers so they can stop.
+                self.host_ready.notify_all()
 
-    def add_url(self, url):
-        url = normalize(url)
+    def _schedule_retry(self, url, retry_at, score, depth):
+        # retry_at is wall clock time, as saved
+        with self.host_ready:
+            heapq.heappush(self.retry_heap, (
+                time.monotonic() + max(0, retry_at - time.time()), url,
+                score, depth))
+            self.host_ready.notify()
+
+    def mark_url_failed(self, url, reason, not_before=0):
+        ''' Called by a worker when downloading url failed. The url is
+        retried later, not before the wall clock time not_before, or marked
+        complete if it failed permanently. '''
+        retry_at = self.retries.failure(url, reason, not_before)
+        host = urlparse(url).netloc
+        open_until = self.retries.host_open_until(host)
+        with self.host_ready:
+            if open_until > time.time():
+                self.next_fetch[host] = max(
+                    self.next_fetch.get(host, 0),
+                    time.monotonic() + open_until - time.time())
+            score, depth = self.handed_out.get(url, (0, 0))
+        if retry_at is None:
+            metrics.incr("failed_urls")
+            self.mark_url_complete(url)
+        else:
+            metrics.incr("retries")
+            self._schedule_retry(url, retry_at, score, depth)
+
+    def mark_url_succeeded(self, url):
+        ''' Called by a worker when url was downloaded. '''
+        self.retries.success(url)
+
+    def get_delay(self, host):
+        return max(self.config.time_delay, self.robots.crawl_delay(host))
+
+    def _score(self, url, depth, page):
+        host = urlparse(url).netloc
+        return self.scorer(url, depth, page, analytics.pages_of(host))
+
+    def _enqueue(self, url, score, depth):
+        host = urlparse(url).netloc
+        with self.host_ready:
+            if self.queues.push(host, score, depth, url):
+                # A host gets a heap entry when its queue becomes non-empty.
+                heapq.heappush(
+                    self.ready_heap, (self.next_fetch.get(host, 0), host))
+                self.host_ready.notify()
+
+    def _child_depth(self, parent):
+        # depth of a url linked from parent, a url being processed
+        if parent is None:
+            return 0
+        with self.host_ready:
+            return self.handed_out.get(parent, (0, 0))[1] + 1
+
+    def add_url(self, url, parent=None, page=None):
+        ''' Adds a url found on parent, a url from get_tbd_url, whose
+        scraper.PageStats are page. Seeds have neither. '''
+        self._add(normalize(url), self._child_depth(parent), page)
+
+    def _add(self, url, depth, page):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
+        score = self._score(url, depth, page)
+        # seen.add may read the save file, so it runs without the lock. The
+        # url is registered as being added meanwhile, so a snapshot taken
+        # after it is saved and before it is queued still counts it pending.
+        key = (url, score, depth)
+        with self.host_ready:
+            self.adding[key] += 1
+        is_new = False
+        try:
+            is_new = self.seen.add(urlhash, (url, False))
+        finally:
+            with self.host_ready:
+                self.adding[key] -= 1
+                if not self.adding[key]:
+                    del self.adding[key]
+                if is_new:
+                    self._enqueue(url, score, depth)
 
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
+        if urlhash not in self.seen:
             # This should not happen.
             self.logger.error(
                 f"Completed url {url}, but have not seen it before.")
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
\ No newline at end of file
+        self.completed.add(urlhash)
+        self.writer.put(urlhash, (url, True))
+
+    def close(self):
+        ''' Flushes pending saves. Called by the crawler once all workers
+        have stopped. '''
+        self.writer.close()
+        page_fingerprints.close()
+        analytics.close()
+        trap_detector.save()
+        self.retries.save()
+        if self.page_store is not None:
+            self.page_store.close()
+        self.queues.close()
+        self.logger.info(self.seen.report())
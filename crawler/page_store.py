@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import zlib
+import pickle
+import struct
+
+from threading import Lock
+
+import requests
+
+from utils import get_logger, get_urlhash
+from utils.response import Response
+
+# magic, length and crc32 of the compressed record that follows
+RECORD_HEADER = struct.Struct("<4sII")
+MAGIC = b"PAGE"
+INDEX_FILE = "index"
+
+
+class PageStore(object):
+    ''' Append-only store of downloaded pages, in compressed segments.
+
+    A record is a header followed by the zlib compressed JSON description
+    of a response (url asked for, url answered, status, error, content
+    type, time), a newline and the pickled requests.Response as the cache
+    server sent it, so storing a page does not decode it. A response that
+    was decoded already is stored with its body instead. Records are
+    appended to the newest segment file, segment-NNNNNN, until it reaches
+    segment_size bytes.
+
+    The index file maps get_urlhash of the url asked for to the segment,
+    offset and length of its newest record. It is appended to after the
+    record is written and loaded into memory on open, so a crash leaves at
+    most a record that is not indexed.
+    '''
+
+    def __init__(self, path, segment_size=256 * 2 ** 20, level=6):
+        self.logger = get_logger("PAGESTORE")
+        self.path = path
+        self.segment_size = segment_size
+        self.level = level
+        self.lock = Lock()
+        # urlhash -> (segment, offset, length)
+        self.index = dict()
+        # file descriptors of segments opened for reading
+        self.readers = dict()
+        os.makedirs(path, exist_ok=True)
+        index_file = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                for line in f:
+                    fields = line.split()
+                    # partial last line from a crash
+                    if len(fields) == 4:
+                        self.index[fields[0]] = tuple(map(int, fields[1:]))
+        segments = [int(name.split("-")[1]) for name in os.listdir(path)
+                    if name.startswith("segment-")]
+        self.segment_number = max(segments, default=0)
+        self.segment = open(self._segment_path(self.segment_number), "ab")
+        self.index_writer = open(index_file, "a")
+        if self.index:
+            self.logger.info(
+                f"Found {len(self.index)} stored pages in {len(segments)} "
+                f"segments of {path}.")
+
+    def _segment_path(self, number):
+        return os.path.join(self.path, f"segment-{number:06d}")
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, url):
+        return get_urlhash(url) in self.index
+
+    def put(self, url, resp):
+        ''' Stores the response to a download of url. Failed downloads and
+        5xx/6xx statuses, which are retried, are not stored. '''
+        if isinstance(resp, Exception) or resp.status >= 500:
+            return False
+        header = {
+            "url": url, "resp_url": resp.url, "status": resp.status,
+            "error": resp.error, "time": time.time()}
+        content = resp.pickled
+        if content is not None:
+            header["pickled"] = True
+        else:
+            raw = resp.raw_response
+            content = raw.content if raw is not None else None
+            header["has_content"] = content is not None
+            header["content_type"] = (
+                raw.headers.get("Content-Type") if raw is not None else None)
+        data = zlib.compress(
+            json.dumps(header).encode("utf-8") + b"\n" + (content or b""),
+            self.level)
+        record = RECORD_HEADER.pack(MAGIC, len(data), zlib.crc32(data)) + data
+        urlhash = get_urlhash(url)
+        with self.lock:
+            if self.segment.tell() >= self.segment_size:
+                self.segment.close()
+                self.segment_number += 1
+                self.segment = open(
+                    self._segment_path(self.segment_number), "ab")
+            offset = self.segment.tell()
+            self.segment.write(record)
+            self.segment.flush()
+            entry = (self.segment_number, offset, len(record))
+            self.index_writer.write(f"{urlhash} {entry[0]} {entry[1]} {entry[2]}\n")
+            self.index_writer.flush()
+            self.index[urlhash] = entry
+        return True
+
+    def _reader(self, number):
+        # called with the lock held
+        fd = self.readers.get(number)
+        if fd is None:
+            fd = self.readers[number] = os.open(
+                self._segment_path(number), os.O_RDONLY)
+        return fd
+
+    def get(self, url):
+        ''' Returns the stored Response for url, or None. '''
+        with self.lock:
+            entry = self.index.get(get_urlhash(url))
+            if entry is None:
+                return None
+            number, offset, length = entry
+            fd = self._reader(number)
+        record = os.pread(fd, length, offset)
+        magic, size, crc = RECORD_HEADER.unpack_from(record)
+        data = record[RECORD_HEADER.size:]
+        if magic != MAGIC or size != len(data) or zlib.crc32(data) != crc:
+            self.logger.error(f"Stored page of {url} is corrupt, ignoring it.")
+            return None
+        header, _, content = zlib.decompress(data).partition(b"\n")
+        return stored_response(json.loads(header), content)
+
+    def close(self):
+        with self.lock:
+            self.segment.close()
+            self.index_writer.close()
+            for fd in self.readers.values():
+                os.close(fd)
+            self.readers = dict()
+
+
+def stored_response(header, content):
+    ''' Rebuilds the Response a stored record was made from. Its size is
+    that of the pickled response, like for a download. '''
+    resp = {"url": header["resp_url"], "status": header["status"],
+            "error": header["error"]}
+    if header.get("pickled"):
+        # decoded only if the page is scraped, like a download
+        resp["response"] = content
+        return Response(resp)
+    resp = Response(resp)
+    if header["has_content"]:
+        raw = requests.models.Response()
+        raw.status_code = header["status"]
+        raw.url = header["resp_url"]
+        raw._content = content
+        if header["content_type"]:
+            raw.headers["Content-Type"] = header["content_type"]
+        resp.raw_response = raw
+        resp.size = len(pickle.dumps(raw, protocol=pickle.HIGHEST_PROTOCOL))
+    return resp
@@ -0,0 +1,205 @@
+import os
+import json
+import shelve
+import shutil
+
+from threading import Thread, Condition, Lock
+
+from utils import get_logger
+from utils.metrics import metrics
+
+
+def shelve_files(save_file):
+    ''' Existing files of the shelve save_file, whose names depend on the
+    dbm module behind it. '''
+    return [path for path in (
+        save_file, f"{save_file}.db", f"{save_file}.dat", f"{save_file}.dir",
+        f"{save_file}.bak") if os.path.exists(path)]
+
+
+class SaveWriter(Thread):
+    ''' Write-behind owner of the shelve save file.
+
+    Workers never touch the shelve directly. put() appends the record to an
+    append-only journal and buffers it in memory. This thread applies the
+    buffered records to the shelve in one batch, with a single sync, once
+    checkpoint_size records are buffered or checkpoint_interval seconds
+    have passed. The journal is rotated before each batch and deleted once
+    the batch is synced, so whatever is left of it at startup is replayed
+    into the shelve. A checkpoint that fails keeps its journal, which is
+    folded back into the current one before the next batch, so its records
+    are written again by that batch and replayed after a crash.
+    '''
+
+    def __init__(self, save_file, restart=False,
+                 checkpoint_size=1000, checkpoint_interval=10):
+        self.logger = get_logger("SAVE")
+        self.journal_file = f"{save_file}.journal"
+        self.checkpoint_size = checkpoint_size
+        self.checkpoint_interval = checkpoint_interval
+        self.save = shelve.open(save_file)
+        # the records replayed from the journal, by hash, for a frontier
+        # restored from a snapshot that may predate them
+        self.replayed = dict()
+        if restart:
+            self._remove_journals()
+        else:
+            self._replay_journal()
+        self.journal = open(self.journal_file, "a")
+        # Replayed records stay journaled until the next checkpoint, which
+        # also writes a snapshot that includes them.
+        self.pending = dict(self.replayed)
+        # the batch being written by checkpoint(), and the lock that guards
+        # the shelve against concurrent lookups
+        self.applying = dict()
+        self.save_lock = Lock()
+        self.stopping = False
+        # whether the last checkpoint saved everything, see checkpoint()
+        self.saved = True
+        # called after every checkpoint, to save state that goes with it
+        self.checkpoint_callbacks = list()
+        self.changed = Condition()
+        super().__init__(daemon=True)
+
+    def _replay_journal(self):
+        replayed = 0
+        for path in (f"{self.journal_file}.old", self.journal_file):
+            if not os.path.exists(path):
+                continue
+            with open(path) as journal:
+                for line in journal:
+                    try:
+                        urlhash, record = json.loads(line)
+                    except ValueError:
+                        # partial last line from a crash
+                        break
+                    self.save[urlhash] = self.replayed[urlhash] = tuple(record)
+                    replayed += 1
+        if replayed:
+            self.save.sync()
+            self.logger.info(f"Replayed {replayed} journaled saves.")
+            with open(f"{self.journal_file}.new", "w") as journal:
+                for urlhash, record in self.replayed.items():
+                    journal.write(json.dumps([urlhash, record]) + "\n")
+            os.replace(f"{self.journal_file}.new", self.journal_file)
+            old = f"{self.journal_file}.old"
+            if os.path.exists(old):
+                os.remove(old)
+        else:
+            self._remove_journals()
+
+    def _remove_journals(self):
+        for path in (f"{self.journal_file}.old", self.journal_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self):
+        ''' Returns the saved (url, completed) records. Only call this
+        before the writer is started. '''
+        return self.save.items()
+
+    def __contains__(self, urlhash):
+        with self.changed:
+            if urlhash in self.pending or urlhash in self.applying:
+                return True
+        with self.save_lock:
+            return urlhash in self.save
+
+    def put(self, urlhash, record):
+        with self.changed:
+            self.journal.write(json.dumps([urlhash, record]) + "\n")
+            self.journal.flush()
+            self.pending[urlhash] = record
+            if len(self.pending) == self.checkpoint_size:
+                self.changed.notify()
+
+    def run(self):
+        while True:
+            with self.changed:
+                # after a failed checkpoint, wait before trying again
+                if not self.stopping and (
+                        not self.saved or
+                        len(self.pending) < self.checkpoint_size):
+                    self.changed.wait(self.checkpoint_interval)
+                stopping = self.stopping
+            self._checkpoint()
+            if stopping:
+                break
+
+    def _checkpoint(self):
+        try:
+            self.saved = self.checkpoint()
+        except Exception:
+            self.saved = False
+            self.logger.exception("Checkpoint failed, its records stay "
+                                  "journaled.")
+
+    def _fold_journal(self):
+        # appends the journal to the one of a failed checkpoint, older
+        # records first, and makes that the current journal
+        old = f"{self.journal_file}.old"
+        self.journal.close()
+        with open(old, "a") as journal, open(self.journal_file) as new:
+            shutil.copyfileobj(new, journal)
+        os.replace(old, self.journal_file)
+        self.journal = open(self.journal_file, "a")
+
+    def checkpoint(self):
+        ''' Applies all buffered records to the shelve. Returns False if a
+        checkpoint callback failed, the records then stay journaled. '''
+        with self.changed:
+            if os.path.exists(f"{self.journal_file}.old"):
+                self._fold_journal()
+            if not self.pending:
+                return True
+            batch = self.applying = self.pending
+            self.pending = dict()
+            # Records put from now on go to a fresh journal, the old one
+            # covers exactly this batch.
+            self.journal.close()
+            os.replace(self.journal_file, f"{self.journal_file}.old")
+            self.journal = open(self.journal_file, "a")
+        try:
+            with self.save_lock, metrics.timer("checkpoint"):
+                for urlhash, record in batch.items():
+                    self.save[urlhash] = record
+                self.save.sync()
+        except Exception:
+            # back to pending, where records put since win
+            with self.changed:
+                batch.update(self.pending)
+                self.pending = batch
+                self.applying = dict()
+            raise
+        with self.changed:
+            self.applying = dict()
+        saved = True
+        for callback in self.checkpoint_callbacks:
+            try:
+                callback()
+            except Exception:
+                saved = False
+                self.logger.exception(
+                    f"Checkpoint callback {callback.__qualname__} failed.")
+        # Only now, so a snapshot written by a callback never misses records
+        # that are neither in it nor in a journal.
+        if saved:
+            os.remove(f"{self.journal_file}.old")
+        return saved
+
+    def close(self):
+        ''' Flushes all buffered records and closes the save file. '''
+        if self.is_alive():
+            with self.changed:
+                self.stopping = True
+                self.changed.notify()
+            self.join()
+        else:
+            self._checkpoint()
+        self.journal.close()
+        if self.saved:
+            os.remove(self.journal_file)
+        else:
+            self.logger.warning("Records left journaled, they are replayed "
+                                "on the next start.")
+        self.save.close()
@@ -0,0 +1,163 @@
+import os
+import heapq
+import sqlite3
+
+from importlib import import_module
+from itertools import count
+
+# weights of the signals default_score combines
+DEPTH_WEIGHT = 1.0
+NEW_HOST_BONUS = 2.0
+TEXT_RATIO_WEIGHT = 1.0
+WORDS_WEIGHT = 1.0
+# parent pages with this many words or more count as fully informative
+WORDS_SATURATION = 1000
+
+
+def default_score(url, depth, page, host_pages):
+    ''' Priority of a url, higher is crawled first.
+
+    depth is the number of links from a seed url, page the PageStats of the
+    page that linked to url (None for seeds and restored urls) and
+    host_pages the number of pages crawled from url's host so far. Shallow
+    urls, hosts nobody has crawled yet and links from pages with a lot of
+    text go first.
+    '''
+    score = -DEPTH_WEIGHT * depth
+    score += NEW_HOST_BONUS / (1 + host_pages)
+    if page is not None:
+        score += TEXT_RATIO_WEIGHT * page.text_ratio
+        score += WORDS_WEIGHT * min(page.words, WORDS_SATURATION) / WORDS_SATURATION
+    return score
+
+
+def load_scorer(path):
+    ''' The function named by path, like crawler.priority.default_score. '''
+    module, _, name = path.rpartition(".")
+    return getattr(import_module(module), name)
+
+
+class HostQueues(object):
+    ''' One priority queue of urls per host, with bounded memory.
+
+    Each host keeps at most memory_per_host of its best urls in a heap in
+    memory, the rest goes to an SQLite table on disk. Every url in memory
+    scores at least as high as every spilled url of its host, so a host's
+    urls come out in exact score order, and the table is only read when a
+    host's heap runs empty. The table is scratch space, the save file and
+    the snapshot are what a restart resumes from. Not thread safe, the
+    frontier calls it with its lock held, except for reading a dump.
+    '''
+
+    def __init__(self, path, memory_per_host=64):
+        self.memory_per_host = memory_per_host
+        # host -> heap of (-score, sequence, depth, url)
+        self.heads = dict()
+        # host -> number of its urls in the table
+        self.spilled = dict()
+        self.sequence = count()
+        self.size = 0
+        for stale in (path, f"{path}-wal", f"{path}-shm"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        self.db = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False)
+        # WAL, so dump() reads a fixed view while the queues keep changing
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute(
+            "CREATE TABLE urls (host TEXT, score REAL, depth INTEGER, url TEXT)")
+        self.db.execute("CREATE INDEX urls_by_score ON urls (host, score)")
+        self.reader = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, host):
+        return host in self.heads
+
+    def push(self, host, score, depth, url):
+        ''' Queues a url. Returns True if its host had no urls queued. '''
+        self.size += 1
+        heap = self.heads.get(host)
+        if heap is None:
+            self.heads[host] = [(-score, next(self.sequence), depth, url)]
+            return True
+        item = (-score, next(self.sequence), depth, url)
+        if not self.spilled.get(host) and len(heap) < self.memory_per_host:
+            heapq.heappush(heap, item)
+            return False
+        worst = max(heap)
+        if item < worst:
+            # better than the worst in memory, which makes room if needed
+            heapq.heappush(heap, item)
+            if len(heap) <= self.memory_per_host:
+                return False
+            heap.remove(worst)
+            heapq.heapify(heap)
+            item = worst
+        self._spill(host, item)
+        return False
+
+    def _spill(self, host, item):
+        negative_score, _, depth, url = item
+        self.db.execute("INSERT INTO urls VALUES (?, ?, ?, ?)",
+                        (host, -negative_score, depth, url))
+        self.spilled[host] = self.spilled.get(host, 0) + 1
+
+    def _refill(self, host, heap):
+        rows = self.db.execute(
+            "SELECT rowid, score, depth, url FROM urls WHERE host = ? "
+            "ORDER BY score DESC LIMIT ?",
+            (host, self.memory_per_host)).fetchall()
+        self.db.executemany(
+            "DELETE FROM urls WHERE rowid = ?", [(row[0],) for row in rows])
+        self.spilled[host] -= len(rows)
+        if not self.spilled[host]:
+            del self.spilled[host]
+        for _, score, depth, url in rows:
+            heapq.heappush(heap, (-score, next(self.sequence), depth, url))
+
+    def best(self, host):
+        ''' Score of the url pop would return. '''
+        return -self.heads[host][0][0]
+
+    def pop(self, host):
+        ''' Returns (score, depth, url) of the best url of a host. '''
+        heap = self.heads[host]
+        negative_score, _, depth, url = heapq.heappop(heap)
+        if not heap:
+            if self.spilled.get(host):
+                self._refill(host, heap)
+            else:
+                del self.heads[host]
+        self.size -= 1
+        return -negative_score, depth, url
+
+    def dump(self):
+        ''' Every queued url. Returns host -> list of (score, depth, url) of
+        the urls in memory, and an iterator of (host, score, depth, url) of
+        the spilled ones.
+
+        Call it with the lock held and consume the iterator after releasing
+        it: the table is read from the view of the moment dump() was called,
+        without blocking the queues. Only one dump at a time. '''
+        queues = {
+            host: [(-negative_score, depth, url)
+                   for negative_score, _, depth, url in heap]
+            for host, heap in self.heads.items()}
+        rows = self.reader.execute("SELECT host, score, depth, url FROM urls")
+        # stepping the statement once fixes its view of the table
+        first = rows.fetchone()
+
+        def spilled():
+            if first is not None:
+                yield first
+                yield from rows
+
+        return queues, spilled()
+
+    def close(self):
+        self.reader.close()
+        self.db.close()
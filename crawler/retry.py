@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import random
+
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils import get_logger
+from utils.metrics import metrics
+
+
+class RetryState(object):
+    ''' Retry attempts of failed urls and a circuit breaker per host.
+
+    A failed url is retried after an exponential backoff with jitter,
+    retry_base_delay * 2 ** (attempts - 1) seconds, at most retry_max_delay,
+    scaled by a random factor in [0.5, 1]. After max_retries failed attempts
+    it fails permanently, which is appended to failed_path with the reason.
+
+    A host that fails breaker_threshold times in a row is not fetched for
+    breaker_cooldown seconds, doubling each time it trips again. After that
+    one more failure trips it again, one success closes it.
+
+    Both are saved as JSON to path, in wall clock time, and survive a
+    restart of the crawler.
+    '''
+
+    def __init__(self, config, path, failed_path, restart):
+        self.logger = get_logger("RETRY")
+        self.config = config
+        self.path = path
+        self.failed_path = failed_path
+        # url -> [attempts, time of the next attempt]
+        self.urls = dict()
+        # host -> [consecutive failures, trips, open until]
+        self.hosts = dict()
+        self.lock = Lock()
+        for stale in (path, failed_path):
+            if restart and os.path.exists(stale):
+                os.remove(stale)
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.urls = state["urls"]
+            self.hosts = state["hosts"]
+            self.logger.info(
+                f"Loaded retry state of {len(self.urls)} urls and "
+                f"{len(self.hosts)} hosts.")
+
+    def __len__(self):
+        return len(self.urls)
+
+    def backoff(self, attempts):
+        delay = min(self.config.retry_max_delay,
+                    self.config.retry_base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1)
+
+    def failure(self, url, reason, not_before=0):
+        ''' Records a failed attempt. Returns the time of the next attempt,
+        at least not_before, or None if the url failed permanently. '''
+        host = urlparse(url).netloc
+        now = time.time()
+        with self.lock:
+            self._host_failure(host, now)
+            attempts = self.urls.get(url, [0, 0])[0] + 1
+            if attempts >= self.config.max_retries:
+                self.urls.pop(url, None)
+                permanent = True
+            else:
+                retry_at = max(now + self.backoff(attempts),
+                               self.hosts[host][2], not_before)
+                self.urls[url] = [attempts, retry_at]
+                permanent = False
+        if permanent:
+            self._record_failed(url, reason, attempts)
+            return None
+        self.logger.info(
+            f"Attempt {attempts} of {url} failed: {reason}, "
+            f"retrying in {retry_at - now:.0f}s.")
+        return retry_at
+
+    def _host_failure(self, host, now):
+        failures, trips, open_until = self.hosts.get(host, [0, 0, 0])
+        failures += 1
+        if failures >= self.config.breaker_threshold:
+            trips += 1
+            open_until = now + min(
+                self.config.retry_max_delay,
+                self.config.breaker_cooldown * 2 ** (trips - 1))
+            # half open once the cooldown is over: one failure trips again
+            failures = self.config.breaker_threshold - 1
+            metrics.incr("breaker_trips")
+            self.logger.warning(
+                f"Circuit breaker for {host} open for "
+                f"{open_until - now:.0f}s after repeated failures.")
+        self.hosts[host] = [failures, trips, open_until]
+
+    def _record_failed(self, url, reason, attempts):
+        self.logger.error(
+            f"Giving up on {url} after {attempts} attempts: {reason}")
+        with self.lock, open(self.failed_path, "a") as f:
+            f.write(json.dumps({
+                "time": time.time(), "url": url, "attempts": attempts,
+                "reason": reason}) + "\n")
+
+    def success(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            self.urls.pop(url, None)
+            if host in self.hosts:
+                del self.hosts[host]
+
+    def host_open_until(self, host):
+        ''' Wall clock time until which the host must not be fetched. '''
+        entry = self.hosts.get(host)
+        return entry[2] if entry else 0
+
+    def retry_time(self, url):
+        ''' Time of the next attempt of a url that failed before, or None. '''
+        entry = self.urls.get(url)
+        return entry[1] if entry else None
+
+    def save(self):
+        with self.lock:
+            data = json.dumps({"urls": self.urls, "hosts": self.hosts})
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
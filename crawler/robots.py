@@ -0,0 +1,135 @@
+import os
+import json
+import time
+
+from threading import Lock
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from utils import get_logger
+from utils.download import download
+
+
+class RobotsCache(object):
+    ''' robots.txt rules of every host, fetched once through the cache server.
+
+    Each host's robots.txt is fetched by exactly one thread; threads racing
+    on the same host wait for that fetch instead of repeating it. Results,
+    including failed fetches, are kept for a TTL and saved next to the
+    frontier save file, so allow checks and crawl delays are answered from
+    memory and survive a restart.
+    '''
+
+    def __init__(self, config, path, restart):
+        self.logger = get_logger("ROBOTS")
+        self.config = config
+        self.path = path
+        # host -> (fetched_at, status, robots.txt text or None)
+        self.entries = dict()
+        self.parsers = dict()
+        self.host_locks = dict()
+        self.lock = Lock()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = {
+                    host: tuple(entry) for host, entry in json.load(f).items()}
+            self.logger.info(f"Loaded robots.txt of {len(self.entries)} hosts.")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _host_lock(self, host):
+        with self.lock:
+            if host not in self.host_locks:
+                self.host_locks[host] = Lock()
+            return self.host_locks[host]
+
+    def _is_fresh(self, entry):
+        fetched_at, status, _ = entry
+        ttl = (self.config.robots_ttl if status is not None and status < 500
+               else self.config.robots_failure_ttl)
+        return time.time() - fetched_at < ttl
+
+    def _get_parser(self, scheme, host):
+        entry = self.entries.get(host)
+        if entry is None or not self._is_fresh(entry):
+            with self._host_lock(host):
+                # another thread may have fetched it while we waited
+                entry = self.entries.get(host)
+                if entry is None or not self._is_fresh(entry):
+                    entry = self._fetch(scheme, host)
+        return self._parser_for(host, entry)
+
+    def _parser_for(self, host, entry):
+        with self.lock:
+            parser = self.parsers.get(host)
+            if parser is None or parser.entry is not entry:
+                parser = self.parsers[host] = self._make_parser(entry)
+            return parser
+
+    def _fetch(self, scheme, host):
+        robots_txt_url = f"{scheme}://{host}/robots.txt"
+        try:
+            resp = download(robots_txt_url, self.config, self.logger)
+            status = resp.status
+            text = None
+            if status == 200 and resp.content is not None:
+                text = resp.content.decode("utf-8", "ignore")
+        except Exception as e:
+            self.logger.warning(f"Error retrieving {robots_txt_url}: {e}")
+            status, text = None, None
+        self.logger.info(f"{robots_txt_url} status: {status}")
+        entry = (time.time(), status, text)
+        with self.lock:
+            self.entries[host] = entry
+            self._save()
+        return entry
+
+    def _make_parser(self, entry):
+        _, status, text = entry
+        parser = RobotFileParser()
+        if status == 200:
+            parser.parse((text or "").splitlines())
+        elif status in (401, 403):
+            parser.disallow_all = True
+        elif status is not None and status < 500:
+            parser.allow_all = True
+        else:
+            # robots.txt could not be retrieved, do not crawl the host
+            parser.disallow_all = True
+        parser.entry = entry
+        return parser
+
+    def _save(self):
+        # written whenever a host is fetched, which happens once per host
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+    def can_fetch(self, url):
+        parsed = urlparse(url)
+        parser = self._get_parser(parsed.scheme, parsed.netloc)
+        return parser.can_fetch(self.config.user_agent, url)
+
+    def unavailable_until(self, url):
+        ''' Wall clock time until which the failed robots.txt fetch of
+        url's host is cached, or None if robots.txt was fetched. can_fetch
+        is False in the meantime, but only for now. '''
+        entry = self.entries.get(urlparse(url).netloc)
+        if entry is None:
+            return None
+        fetched_at, status, _ = entry
+        if status is not None and status < 500:
+            return None
+        return fetched_at + self.config.robots_failure_ttl
+
+    def crawl_delay(self, host):
+        ''' Crawl delay of a host from its cached robots.txt, 0 if unknown. '''
+        entry = self.entries.get(host)
+        if entry is None:
+            return 0
+        return self._parser_for(host, entry).crawl_delay(
+            self.config.user_agent) or 0
@@ -0,0 +1,213 @@
+import os
+import copy
+import time
+
+from hashlib import blake2b
+from multiprocessing import get_context
+from queue import Empty
+from threading import Thread, Lock
+from urllib.parse import urlparse
+
+import scraper
+from utils import get_logger, normalize
+from utils.analytics import CrawlAnalytics
+from utils.seen import UrlHashSet
+from utils.word_counts import make_word_counts
+from crawler import Crawler
+from crawler.frontier import Frontier
+
+# indexes into the state array shared by all shards, per shard
+IDLE, SENT, RECEIVED = range(3)
+
+
+def shard_of(host, shard_count):
+    ''' Shard that crawls a host, the same in every process and run. '''
+    digest = blake2b(host.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shard_count
+
+
+def shard_config(config, shard_id):
+    ''' Copy of config for one shard, with its own save, page store and
+    metrics files. '''
+    config = copy.copy(config)
+    config.shard_id = shard_id
+    config.save_file = f"{config.save_file}.shard{shard_id}"
+    if config.page_store:
+        config.page_store = f"{config.page_store}.shard{shard_id}"
+    if config.metrics_file:
+        root, ext = os.path.splitext(config.metrics_file)
+        config.metrics_file = f"{root}.shard{shard_id}{ext}"
+    if config.metrics_port:
+        config.metrics_port += shard_id
+    return config
+
+
+class ShardedFrontier(Frontier):
+    ''' Frontier of one shard of a sharded crawl.
+
+    Urls of hosts owned by another shard are not queued here but forwarded
+    to that shard's inbox in batches, once forward_batch_size urls are
+    buffered or every forward_interval seconds. A receiver thread adds the
+    urls arriving in this shard's inbox.
+
+    The crawl ends when every shard is idle and every batch sent was also
+    received. Counts of both, and an idle flag per shard, live in an array
+    shared by all shards.
+    '''
+
+    def __init__(self, config, restart, inboxes, state):
+        self.shard_id = config.shard_id
+        self.shard_count = len(inboxes)
+        self.inboxes = inboxes
+        self.state = state
+        self.outboxes = [list() for _ in inboxes]
+        self.outbox_lock = Lock()
+        # urls already forwarded, so each is sent to its shard only once
+        self.forwarded = UrlHashSet()
+        self.stopping = False
+        super().__init__(config, restart)
+        self.receiver = Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+
+    def _owner(self, url):
+        return shard_of(urlparse(url).netloc, self.shard_count)
+
+    def _set_state(self, field, value):
+        with self.state.get_lock():
+            self.state[self.shard_id * 3 + field] = value
+
+    def _increment_state(self, field):
+        with self.state.get_lock():
+            self.state[self.shard_id * 3 + field] += 1
+
+    def add_url(self, url, parent=None, page=None):
+        owner = self._owner(url)
+        if owner == self.shard_id:
+            super().add_url(url, parent, page)
+            return
+        url = normalize(url)
+        if not self.forwarded.add(url):
+            return
+        # the owner scores the url, with what is known about it here
+        depth = self._child_depth(parent)
+        with self.outbox_lock:
+            outbox = self.outboxes[owner]
+            outbox.append((url, depth, page))
+            if len(outbox) >= self.config.forward_batch_size:
+                self._flush(owner)
+
+    def _flush(self, owner):
+        # called with outbox_lock held; counted as sent before it is put,
+        # so a batch in flight always keeps the crawl alive
+        batch = self.outboxes[owner]
+        if not batch:
+            return
+        self.outboxes[owner] = list()
+        self._increment_state(SENT)
+        self.inboxes[owner].put(batch)
+
+    def flush_all(self):
+        with self.outbox_lock:
+            for owner in range(self.shard_count):
+                self._flush(owner)
+
+    def _receive(self):
+        inbox = self.inboxes[self.shard_id]
+        while not self.stopping:
+            try:
+                batch = inbox.get(timeout=self.config.forward_interval)
+            except Empty:
+                self.flush_all()
+                continue
+            with self.host_ready:
+                # busy again before the batch counts as received
+                self._set_state(IDLE, 0)
+                for url, depth, page in batch:
+                    self._add(url, depth, page)
+                self._increment_state(RECEIVED)
+                # wake workers waiting for the crawl to end
+                self.host_ready.notify_all()
+            self.flush_all()
+
+    def _crawl_finished(self):
+        with self.state.get_lock():
+            values = self.state[:]
+        idle = values[IDLE::3]
+        return all(idle) and sum(values[SENT::3]) == sum(values[RECEIVED::3])
+
+    def get_tbd_url(self):
+        while True:
+            url = super().get_tbd_url()
+            if url:
+                return url
+            # Nothing to do here, but other shards may still send urls.
+            self.flush_all()
+            with self.host_ready:
+                if self.queues or self.in_progress or self.retry_heap:
+                    continue
+                self._set_state(IDLE, 1)
+            if self._crawl_finished():
+                return None
+            with self.host_ready:
+                if not self.queues:
+                    self.host_ready.wait(self.config.forward_interval)
+
+    def close(self):
+        self.stopping = True
+        self.receiver.join()
+        super().close()
+
+
+def run_shard(config, restart, worker_factory, inboxes, state):
+    crawler = Crawler(
+        config, restart, frontier_factory=lambda config, restart:
+        ShardedFrontier(config, restart, inboxes, state),
+        worker_factory=worker_factory)
+    crawler.start()
+
+
+class ShardedCrawler(object):
+    ''' Runs config.shards crawler processes, each crawling the hosts that
+    shard_of assigns to it with its own frontier, save file and workers.
+    Once all shards are done, their analytics are merged into the report
+    of the whole crawl. '''
+
+    def __init__(self, config, restart, worker_factory):
+        self.config = config
+        self.restart = restart
+        self.worker_factory = worker_factory
+        self.logger = get_logger("CRAWLER")
+
+    def start(self):
+        context = get_context("spawn")
+        shards = self.config.shards
+        inboxes = [context.Queue() for _ in range(shards)]
+        state = context.Array("q", 3 * shards)
+        processes = [
+            context.Process(
+                target=run_shard,
+                args=(shard_config(self.config, shard_id), self.restart,
+                      self.worker_factory, inboxes, state))
+            for shard_id in range(shards)]
+        start = time.time()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.logger.info(
+            f"{shards} shards finished in {time.time() - start:.1f}s.")
+        self.merge_analytics()
+
+    def merge_analytics(self):
+        save_file = self.config.save_file
+        merged = CrawlAnalytics()
+        merged.open(f"{save_file}.analytics", True,
+                    make_word_counts(self.config, f"{save_file}.words"))
+        for shard_id in range(self.config.shards):
+            path = f"{save_file}.shard{shard_id}.analytics"
+            if os.path.exists(path):
+                merged.merge(CrawlAnalytics.load(path))
+        merged.close()
+        self.logger.info(f"Report of all {self.config.shards} shards:")
+        for line in merged.report():
+            scraper.logger.info(line)
@@ -0,0 +1,119 @@
+import os
+import mmap
+import time
+import struct
+
+# magic, version, written at, Bloom filter bits, hashes and count, completed
+# url hashes, hosts, pending urls
+HEADER = struct.Struct("<8sIdQQQQQQ")
+MAGIC = b"FRONTSNP"
+VERSION = 2
+# per host: offset of its urls, number of urls, seconds until it may be
+# fetched again
+HOST_ENTRY = struct.Struct("<QId")
+LENGTH = struct.Struct("<I")
+# per url: priority score, depth and length of the url
+URL_ENTRY = struct.Struct("<dHI")
+
+
+def _padding(offset):
+    # the completed hashes are read as an array of 8-byte integers
+    return -offset % 8
+
+
+def write_snapshot(path, bloom_bits, bloom_hashes, bloom_count, completed,
+                   hosts):
+    ''' Writes a snapshot to path, replacing the previous one atomically.
+
+    completed is a sorted array of completed url keys, hosts a list of
+    (host, seconds until it may be fetched, list of (score, depth, url)). '''
+    pending = sum(len(urls) for _, _, urls in hosts)
+    header = HEADER.pack(
+        MAGIC, VERSION, time.time(), len(bloom_bits) * 8, bloom_hashes,
+        bloom_count, len(completed), len(hosts), pending)
+    offset = HEADER.size + len(bloom_bits)
+    offset += _padding(offset) + 8 * len(completed)
+    offset += HOST_ENTRY.size * len(hosts)
+    table = list()
+    blocks = list()
+    for host, delay, urls in hosts:
+        table.append(HOST_ENTRY.pack(offset, len(urls), delay))
+        block = [LENGTH.pack(len(host)), host.encode("utf-8")]
+        for score, depth, url in urls:
+            encoded = url.encode("utf-8")
+            block.append(URL_ENTRY.pack(score, min(depth, 0xffff), len(encoded)))
+            block.append(encoded)
+        block = b"".join(block)
+        blocks.append(block)
+        offset += len(block)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(bloom_bits)
+        f.write(bytes(_padding(HEADER.size + len(bloom_bits))))
+        f.write(completed)
+        f.write(b"".join(table))
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp, path)
+    return pending
+
+
+class FrontierSnapshot(object):
+    ''' Read side of a snapshot written by write_snapshot, memory mapped.
+
+    Layout: header, Bloom filter bits, sorted 64-bit keys of completed urls,
+    a table of one entry per host, then per host its name and pending urls
+    with their priority. The Bloom filter and the completed keys are used as
+    they are, only the pending urls are decoded, one host at a time. '''
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.written_at, bloom_bits, self.bloom_hashes,
+         self.bloom_count, self.completed_count, self.host_count,
+         self.pending_count) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a frontier snapshot.")
+        self.bloom_start = HEADER.size
+        self.bloom_end = self.bloom_start + bloom_bits // 8
+        self.completed_start = self.bloom_end + _padding(self.bloom_end)
+        self.table_start = self.completed_start + 8 * self.completed_count
+
+    @staticmethod
+    def open(path):
+        ''' Returns the snapshot at path, or None if there is no valid one. '''
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return None
+        try:
+            return FrontierSnapshot(path)
+        except (ValueError, struct.error):
+            return None
+
+    def bloom_bits(self):
+        return memoryview(self.map)[self.bloom_start:self.bloom_end]
+
+    def completed(self):
+        ''' The sorted completed keys, without copying them. '''
+        return memoryview(self.map)[
+            self.completed_start:self.table_start].cast("Q")
+
+    def hosts(self):
+        ''' Yields (host, seconds until it may be fetched, pending urls as
+        (score, depth, url)). '''
+        data = self.map
+        for i in range(self.host_count):
+            offset, count, delay = HOST_ENTRY.unpack_from(
+                data, self.table_start + i * HOST_ENTRY.size)
+            (length,) = LENGTH.unpack_from(data, offset)
+            offset += LENGTH.size
+            host = data[offset:offset + length].decode("utf-8")
+            offset += length
+            urls = list()
+            for _ in range(count):
+                score, depth, length = URL_ENTRY.unpack_from(data, offset)
+                offset += URL_ENTRY.size
+                urls.append((score, depth,
+                             data[offset:offset + length].decode("utf-8")))
+                offset += length
+            yield host, delay, urls
@@ -4,21 +4,25 @@ from threading import Thread
 from inspect import getsource
 from urllib.error import URLError
 from urllib.parse import urlparse, urljoin
-from urllib.robotparser import RobotFileParser
+
+import requests
 
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
 import scraper
 import time
 
 
-class Worker(Thread):
-    permissions = {}
-    crawl_delays = {}
-    retry_attempts = 6
-    retry_delay = 10
+# what a failed download raises; requests wraps most errors in
+# RequestException, the rest come from the socket layer
+DOWNLOAD_ERRORS = (requests.exceptions.RequestException, URLError,
+                   socket.timeout, ConnectionError, TimeoutError)
 
+
+class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
+        self.worker_id = worker_id
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
@@ -33,85 +37,122 @@ class Worker(Thread):
 
     def run(self):
         while True:
-            tbd_url = self.frontier.get_tbd_url()
+            # waiting here includes the politeness delay
+            with metrics.timer("frontier_wait"):
+                tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
-                self.logger.info(f"Number of domains crawled: {len(self.permissions)}")
+                self.logger.info(f"Number of domains crawled: {len(self.frontier.robots)}")
                 self.logger.info("Frontier is empty. Stopping Crawler.")
-                self.generate_report()  # Call generate_report() here
                 break
+            start = time.perf_counter()
+            try:
+                self.process(tbd_url)
+            finally:
+                # lets the frontier know this worker may stop adding urls
+                self.frontier.task_done(tbd_url)
+                busy = time.perf_counter() - start
+                metrics.observe("process", busy)
+                metrics.add_busy(self.worker_id, busy)
+
+    def process(self, tbd_url):
+        # a page stored by an earlier run is not downloaded again
+        resp = self.stored_response(tbd_url)
+        if resp is None:
             domain = self.get_domain(tbd_url)
-            politeness_delay = self.get_politeness_delay(domain, tbd_url)
-            permission = self.get_permission(domain, tbd_url)
-            if permission:
-                if politeness_delay:
-                    time.sleep(politeness_delay)
-                resp = self.download_with_retry(tbd_url)
-                if resp:
-                    if 600 <= resp.status < 700:
-                        self.logger.info(f"Ignoring url {tbd_url}, status: {resp.status}")
-                        continue
-                    self.logger.info(
-                        f"Downloaded {tbd_url}, status <{resp.status}> , "
-                        f"using cache {self.config.cache_server}.")
-                    scraped_urls = scraper.scraper(tbd_url, resp)
-                    for scraped_url in scraped_urls:
-                        self.frontier.add_url(scraped_url)
-                    self.frontier.mark_url_complete(tbd_url)
-                    time.sleep(self.config.time_delay)
-                else:
-                    self.logger.error(f"Failed to connect {tbd_url}")
-            else:
-                self.logger.warning(f"Permission denied for {domain}")
+            if not self.check_robots(domain, tbd_url):
+                return
+            resp = self.download_once(tbd_url)
+            self.store_response(tbd_url, resp)
+        self.handle_response(tbd_url, resp)
+
+    def stored_response(self, url):
+        page_store = self.frontier.page_store
+        if page_store is None:
+            return None
+        with metrics.timer("page_store_read"):
+            resp = page_store.get(url)
+        if resp is not None:
+            metrics.incr("stored_pages")
+        return resp
+
+    def store_response(self, url, resp):
+        page_store = self.frontier.page_store
+        if page_store is not None:
+            with metrics.timer("page_store_write"):
+                page_store.put(url, resp)
+
+    def check_robots(self, domain, url):
+        # robots.txt is fetched once per host and shared by all workers.
+        # The frontier applies its crawl delay, no sleeping here.
+        with metrics.timer("robots"):
+            permission = self.frontier.robots.can_fetch(url)
+        if permission:
+            return True
+        retry_at = self.frontier.robots.unavailable_until(url)
+        if retry_at is not None:
+            # robots.txt could not be fetched, which is transient: retry the
+            # url once the failure is no longer cached
+            self.frontier.mark_url_failed(
+                url, "robots.txt unavailable", retry_at)
+            return False
+        self.logger.warning(
+            f"Permission denied for {url}", extra={"url": url})
+        metrics.incr("robots_denied")
+        self.frontier.mark_url_complete(url)
+        return False
+
+    def handle_response(self, tbd_url, resp):
+        if isinstance(resp, Exception):
+            metrics.incr("download_failures")
+            self.frontier.mark_url_failed(
+                tbd_url, f"{type(resp).__name__}: {resp}")
+            return
+        metrics.incr(f"status.{resp.status}")
+        metrics.incr("bytes", resp.size)
+        if resp.status >= 500:
+            # server errors and 6xx cache server errors may be transient
+            self.frontier.mark_url_failed(tbd_url, f"status {resp.status}")
+            return
+        self.frontier.mark_url_succeeded(tbd_url)
+        self.logger.info(
+            f"Downloaded {tbd_url}, status <{resp.status}> , "
+            f"using cache {self.config.cache_server}.", extra={"url": tbd_url})
+        with metrics.timer("scrape"):
+            scraped_urls = scraper.scraper(tbd_url, resp)
+        # the page is not needed any more, free it before adding the links
+        resp.release()
+        # what the priority function learns about the links' parent page
+        page = scraper.page_stats.pop(tbd_url, None)
+        with metrics.timer("frontier_add"):
+            for scraped_url in scraped_urls:
+                self.frontier.add_url(scraped_url, tbd_url, page)
+            self.frontier.mark_url_complete(tbd_url)
 
     def get_domain(self, url):
         return urlparse(url).netloc
 
-    def get_politeness_delay(self, domain, url):
-        if domain in self.crawl_delays:
-            return self.crawl_delays[domain]
-        else:
-            try:
-                robots_txt_url = f"{urlparse(url).scheme}://{domain}/robots.txt"
-                robots_parser = RobotFileParser()
-                robots_parser.set_url(robots_txt_url)
-                robots_parser.read()
-                crawl_delay = robots_parser.crawl_delay(self.config.user_agent)
-                self.crawl_delays[domain] = crawl_delay if crawl_delay else 0
-                return self.crawl_delays[domain]
-            except Exception as e:
-                self.logger.info(f"Error retrieving politeness delay: {e}")
-                return 0
-
-    def get_permission(self, domain, url):
-        if domain in self.permissions:
-            return self.permissions[domain]
-        else:
-            try:
-                robots_txt_url = f"{urlparse(url).scheme}://{domain}/robots.txt"
-                robots_parser = RobotFileParser()
-                robots_parser.set_url(robots_txt_url)
-                robots_parser.read()
-                permission = robots_parser.can_fetch(self.config.user_agent, domain)
-                self.logger.info(f"{domain} permission: {permission}")
-                self.permissions[domain] = permission
-                return permission
-            except URLError as e:
-                self.logger.warning(f"Connection failed {e}")
-                return False
-            except Exception as e:
-                self.logger.info(f"Error retrieving permission: {e}")
-                return False
-
-    def download_with_retry(self, url):
-        attempts = 0
-        while attempts < self.retry_attempts:
-            try:
+    def download_once(self, url):
+        ''' Returns the Response, or the exception if the download failed.
+        Failed urls are retried later by the frontier, not here. '''
+        try:
+            with metrics.timer("download"):
                 return download(url, self.config, self.logger)
-            except (URLError, socket.timeout, ConnectionError, ConnectionRefusedError, TimeoutError) as e:
-                self.logger.warning(f"Download Attempts {attempts + 1} failed: {e}")
-                time.sleep(self.retry_delay)
-                attempts += 1
-        return None
-
-    def generate_report(self):
-        scraper.generate_report()  # Call generate_report() from scraper module
+        except DOWNLOAD_ERRORS as e:
+            self.logger.warning(
+                f"Download of {url} failed: {e}", extra={"url": url})
+            return e
+
+
+class ReplayWorker(Worker):
+    ''' Worker that only scrapes pages from the frontier's page store and
+    never downloads. Urls that are not stored are skipped. '''
+
+    def process(self, tbd_url):
+        resp = self.stored_response(tbd_url)
+        if resp is None:
+            metrics.incr("replay_missing")
+            self.logger.info(
+                f"{tbd_url} is not stored, skipping it.", extra={"url": tbd_url})
+            self.frontier.mark_url_complete(tbd_url)
+            return
+        self.handle_response(tbd_url, resp)
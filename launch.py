@@ -1,18 +1,58 @@
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
-from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
+from crawler.shard import ShardedCrawler
+from crawler.worker import Worker, ReplayWorker
 from scraper import generate_report
+from utils.analytics import CrawlAnalytics
 
 
-def main(config_file, restart):
+def print_report(config_file):
+    # reads the analytics checkpoint, works while a crawl is running
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    for line in CrawlAnalytics.load(f"{config.save_file}.analytics").report():
+        print(line)
+
+
+def parse_cache_server(address):
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def main(config_file, restart, cache_server=None, replay=False):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    if replay:
+        # Stored pages only, without network or politeness delay, from the
+        # seed urls and into a save file of its own.
+        assert config.page_store, "Set PAGESTORE in config.ini to replay"
+        config.save_file = f"{config.save_file}.replay"
+        config.time_delay = 0
+        restart = True
+    elif cache_server:
+        # skip registration, e.g. for benchmarks.cache_server
+        config.cache_server = parse_cache_server(cache_server)
+    else:
+        # spacetime is only needed to register with the real cache server
+        from utils.server_registration import get_cache_server
+        config.cache_server = get_cache_server(config, restart)
+    if replay:
+        worker_factory = ReplayWorker
+    elif config.worker_model == "async":
+        # aiohttp is only needed for this worker model
+        from crawler.async_worker import AsyncWorker
+        worker_factory = AsyncWorker
+    else:
+        worker_factory = Worker
+    if config.shards > 1:
+        crawler = ShardedCrawler(config, restart, worker_factory)
+    else:
+        crawler = Crawler(config, restart, worker_factory=worker_factory)
     # crawler.register_callback(generate_report)
     crawler.start()
 
@@ -20,5 +60,13 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--report", action="store_true", default=False)
+    parser.add_argument("--cache_server", type=str, default=None,
+                        help="host:port of a cache server to use without registering")
+    parser.add_argument("--replay", action="store_true", default=False,
+                        help="crawl the stored pages again, without downloading")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    if args.report:
+        print_report(args.config_file)
+    else:
+        main(args.config_file, args.restart, args.cache_server, args.replay)
@@ -1,34 +1,73 @@
-import re
+import time
 from urllib.parse import urlparse, urlunparse, urljoin
-from bs4 import BeautifulSoup
-from collections import Counter
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from simhash import Simhash
-import nltk
-from nltk.corpus import stopwords
 from utils import get_logger
-nltk.download('punkt')
+from utils.metrics import metrics
+from utils.simhash_index import SimhashIndex
+from utils.fingerprints import PageFingerprints, ExactFingerprint, content_simhash
+from utils.extract import extract
+from utils.url_filter import UrlFilter
+from utils.traps import TrapDetector
+from utils.analytics import CrawlAnalytics
+from utils.tokenizer import STOP_WORDS, words
 
-# Download stopwords (if not already downloaded)
-nltk.download('stopwords')
+# English stopwords, bundled with the tokenizer
+stop_words = STOP_WORDS
 
-# Get the list of English stopwords
-stop_words = set(stopwords.words('english'))
+# report data, updated as pages are merged
+analytics = CrawlAnalytics()
 
-# stores visited URLs and guarantees no duplicates
-visited_urls = set()
+# index of simhash fingerprints of URL paths
+simhash_index = SimhashIndex(k=1)
 
-# data structures to help generate report
-page_lengths = {}
-word_frequencies = Counter()
-subdomains = Counter()
-unique_pages = set()
+# url rules, compiled once, with a count of rejections per rule
+url_filter = UrlFilter()
 
-# dict of simhashes of URLs
-simhash_dict = {}
+# exact and near-duplicate fingerprints of page contents
+page_fingerprints = PageFingerprints(k=3)
+
+# url templates whose pages stopped yielding new content or links
+trap_detector = TrapDetector()
+
+# optional pool of processes that run parse_page off the GIL
+parse_pool = None
 
 logger = get_logger("CRAWLER")
 
 min_word_len= 2
+# pages larger than this many bytes are not parsed
+max_page_size = 5000000
+
+# Everything parse_page learns about a page. Only this compact record, not
+# the parsed document, travels back from a parse process.
+PageRecord = namedtuple("PageRecord", [
+    "word_counts", "length", "subdomain", "clean_url",
+    "exact", "simhash", "text_ratio", "links", "rejects", "timings"])
+
+# What the frontier's priority function knows about the page a link was
+# found on. merge_page leaves one per page in page_stats, the worker takes
+# it out when it adds the page's links.
+PageStats = namedtuple("PageStats", ["text_ratio", "words"])
+page_stats = dict()
+
+
+def start_parse_pool(processes):
+    ''' Parses pages in a pool of worker processes from now on. '''
+    global parse_pool
+    # spawn rather than fork, the crawler is multi-threaded by then
+    parse_pool = ProcessPoolExecutor(
+        max_workers=processes, mp_context=get_context("spawn"))
+
+
+def stop_parse_pool():
+    global parse_pool
+    if parse_pool:
+        parse_pool.shutdown()
+        parse_pool = None
+
 
 def scraper(url, resp):
     links = extract_next_links(url, resp)
@@ -36,194 +75,151 @@ def scraper(url, resp):
 
 
 def extract_next_links(url, resp):
-    urls = []
-    redirect_count = 0
-    global visited_urls
-    global simhash_dict
-    if is_valid(resp.url):
-        if resp.status != 200:
-            print(f"error: {resp.error}")
+    if not is_valid(resp.url):
+        return []
+    if resp.status != 200:
+        logger.info(f"Status {resp.status} for {url}: {resp.error}",
+                    extra={"url": url})
+        trap_detector.record_page(url, False, 0, 0)
+        return []
+    content = resp.content
+    if not content:
+        return []
+    # Check for large files before spending time parsing them
+    if len(content) > max_page_size:
+        metrics.incr("pages_too_large")
+        logger.info(f"Skipping {url}, {len(content)} bytes is too large",
+                    extra={"url": url})
+        return []
+    with metrics.timer("parse"):
+        if parse_pool:
+            record = parse_pool.submit(parse_page, url, resp.url, content).result()
         else:
-            content = resp.raw_response.content
-            if content:
-                soup = BeautifulSoup(content, 'html.parser')
-                # Tokenize the text
-                words = nltk.word_tokenize(soup.get_text())
-                # Filter out stopwords and non-alphabetic words
-                words = [word.lower() for word in words if len(word) >= min_word_len and word.isalpha() and word.lower() not in stop_words]
-                # Exclude domain "ics.uci.edu" from words
-                words = [word for word in words if word != "ics.uci.edu"]
-                # Update word frequencies
-                word_frequencies.update(words)
-
-                # update page length
-                page_lengths[url] = len(words)
-
-                # update unique pages count
-                parsed_url = urlparse(url)
-                clean_url = urlunparse(parsed_url._replace(fragment=''))
-                unique_pages.add(clean_url)
-
-                # update subdomains count
-                if parsed_url.netloc.endswith('ics.uci.edu'):
-                    subdomain = parsed_url.netloc.split('.ics.uci.edu')[0]
-                    subdomains[subdomain] += 1
-
-                # calculates text ratio whether there's a good amount of relevant text info.
-                text_ratio = len(soup.get_text(strip=True)) / len(content)
-
-                if text_ratio > 0.1:
-                    # Check for redirection
-                    if resp.status >= 300 and resp.status < 400:
-                        # Handle redirection
-                        if 'Location' in resp.headers:
-                            redirect_url = resp.headers['Location']
-                            redirect_count+=1
-                            if redirect_count > 30:
-                                print("Exceeded maximum redirects. Skipping:", redirect_url)
-                                return urls
-                            # Checking for if redirected URL is already in visited URLs
-                            if redirect_url in visited_urls:
-                                return urls
-                            # Add redirected URL to visited_urls
-                            visited_urls.add(redirect_url)
-                            url = redirect_url
-                            redirect_count = 0
-
-                    # Check for dead URLS and large files
-                    if len(content) == 0 or len(content) > 5000000:
-                        return urls
-
-                links = soup.find_all(['a', 'link'])
-                for link in links:
-                    if link.name == 'a':
-                        href = link.get('href')
-                    elif link.name == 'link':
-                        href = link.get('href')
-                        rel = link.get('rel')
-                        if rel and 'stylesheet' not in rel:
-                            continue
-                    if href:
-                        # remove fragment from URL
-                        parsed_href = urlparse(href)
-                        cleaned_href = urlunparse(parsed_href._replace(fragment=''))
-                        # makes sure the URL is absolute
-                        absolute_url = urljoin(resp.url, cleaned_href)
-
-                        # Remove query parameters from the URL
-                        parsed_absolute_url = urlparse(absolute_url)
-                        cleaned_absolute_url = parsed_absolute_url._replace(query='').geturl()
-                        if is_valid(cleaned_absolute_url):
-                            # checks for near duplicate
-                            if is_near_duplicate(absolute_url, simhash_dict):
-                                print(f"{absolute_url} is a near duplicate with path {parsed_href}")
-                                continue
-                            # URL appended after all checks
-                            urls.append(cleaned_absolute_url)
-    return urls
+            record = parse_page(url, resp.url, content)
+    with metrics.timer("merge"):
+        return merge_page(url, record)
+
+
+def parse_page(url, base_url, content):
+    ''' The CPU heavy part of scraping. Depends on nothing but its
+    arguments, so it can run in another process. '''
+    # Time spent in each stage, recorded by merge_page, since this may
+    # run in another process
+    timings = {}
+    start = time.perf_counter()
+    # Text and links come out of one streaming pass over the html
+    text, stripped_length, hrefs = extract(content)
+    timings["extract"] = time.perf_counter() - start
+
+    # Count the words that are long enough, alphabetic and not stopwords,
+    # fingerprinting them in the same pass
+    start = time.perf_counter()
+    word_counts = Counter()
+    exact = ExactFingerprint()
+    length = 0
+    for word in words(text, min_word_len, stop_words):
+        word_counts[word] += 1
+        exact.update(word)
+        length += 1
+
+    if length:
+        exact = exact.value()
+        near = content_simhash(word_counts)
+    else:
+        exact = near = None
+    timings["tokenize"] = time.perf_counter() - start
+
+    parsed_url = urlparse(url)
+    clean_url = urlunparse(parsed_url._replace(fragment=''))
+    subdomain = None
+    if parsed_url.netloc.endswith('ics.uci.edu'):
+        subdomain = parsed_url.netloc.split('.ics.uci.edu')[0]
+
+    # calculates text ratio whether there's a good amount of relevant text info.
+    text_ratio = stripped_length / len(content)
+
+    start = time.perf_counter()
+    candidates = []
+    for href in hrefs:
+        # makes sure the URL is absolute, parsing it only once
+        parsed = urlparse(urljoin(base_url, href))
+        # Remove query parameters and fragment from the URL
+        cleaned_absolute_url = urlunparse(parsed._replace(query='', fragment=''))
+        candidates.append((cleaned_absolute_url, parsed))
+
+    # Filter the whole link list in one call. Rejections are counted in the
+    # record, this may run in another process.
+    rejects = Counter()
+    valid = url_filter.is_valid_many(
+        [cleaned for cleaned, _ in candidates], rejects)
+    links = [
+        (cleaned, Simhash(f"{parsed.path}?{parsed.query}").value)
+        for (cleaned, parsed), ok in zip(candidates, valid) if ok]
+    timings["links"] = time.perf_counter() - start
+    return PageRecord(word_counts, length, subdomain, clean_url,
+                      exact, near, text_ratio, links, rejects, timings)
+
+
+def merge_page(url, record):
+    ''' Applies a PageRecord to the shared crawl state and returns the
+    links to add to the frontier. '''
+    url_filter.add_hits(record.rejects)
+    metrics.add_counts(record.rejects, "rejects.")
+    metrics.observe_all(record.timings)
+    # Skip pages whose content was already seen under another URL
+    with metrics.timer("content_duplicate"):
+        is_duplicate = record.exact is not None and not page_fingerprints.add_fingerprints(
+            record.exact, record.simhash)
+    if is_duplicate:
+        metrics.incr("duplicate_pages")
+        logger.info(f"Duplicate content, skipping {url}", extra={"url": url})
+        trap_detector.record_page(url, False, len(record.links), 0)
+        return []
+    metrics.incr("pages")
+
+    analytics.add_page(url, record.clean_url, record.subdomain,
+                       record.length, record.word_counts)
+
+    start = time.perf_counter()
+    urls = []
+    for cleaned_absolute_url, fingerprint in record.links:
+        # checks for near duplicate
+        if not simhash_index.add_if_unique(fingerprint):
+            # one per link, counted in the metrics and off by default
+            logger.debug(f"{cleaned_absolute_url} is a near duplicate",
+                         extra={"url": cleaned_absolute_url})
+            continue
+        # URL appended after all checks
+        urls.append(cleaned_absolute_url)
+    metrics.incr("near_duplicate_links", len(record.links) - len(urls))
+    metrics.observe("near_duplicate", time.perf_counter() - start)
+
+    # Learn from what this page yielded, then drop links of url templates
+    # that turned out to be traps
+    trap_detector.record_page(url, True, len(record.links), len(urls))
+    admitted = [link for link in urls if trap_detector.admit(link)]
+    metrics.incr("trap_rejects", len(urls) - len(admitted))
+    if admitted:
+        page_stats[url] = PageStats(record.text_ratio, record.length)
+    return admitted
 
 
 def is_valid(url):
     try:
-        # uci websites to be crawled
-        allowed_domains = [
-            "ics.uci.edu",
-            "cs.uci.edu",
-            "informatics.uci.edu",
-            "stat.uci.edu"
-        ]
-        parsed = urlparse(url)
-        # if the website is not within the allowed domains, return false
-        if parsed.netloc.endswith(tuple(allowed_domains)) and parsed.netloc != 'physics.uci.edu':
-            if parsed.scheme not in set(["http", "https"]):
-                return False
-
-            # Trap checking for certain words in path and query
-            query_bl = {"ical", "rev"}
-            if any([(query in parsed.query) for query in query_bl]):
-                return False
-
-            path_blacklist = {"/events/", "/day/", "/week/", "/month/", "/list/", "?filter", "img"}
-            if any([(path in parsed.path.lower()) for path in path_blacklist]):
-                return False
-
-            # Check if URL contains repeated words
-            if len(parsed.path.split("/")) != len(set(parsed.path.split("/"))):
-                return False
-
-            # Checks if length of link is too long
-            if len(url) > 200:
-                return False
-
-            # Trap checking for slideshows and datasheets
-            if (re.search("[sS]li?de?s?[_-]?\d", url) != None or re.search("sheets?-?\d", url)):
-                return False
-
-            return not re.match(
-                r".*\.(css|js|bmp|gif|jpe?g|ico"
-                + r"|png|tiff?|mid|mp2|mp3|mp4"
-                + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-                + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-                + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-                + r"|epub|dll|cnf|tgz|sha1"
-                + r"|thmx|mso|arff|rtf|jar|csv"
-                + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
-        else:
-            return False
-
+        return url_filter.is_valid(url)
     except TypeError:
-        print("TypeError for ", parsed)
+        logger.error(f"TypeError for {url!r}")
         raise
 
 
-def is_near_duplicate(url, simhash_dict):
-    # extract path with given url
-    new_path = urlparse(url).path
-    # extract query with given url
-    new_query = urlparse(url).query
-    # create a combined path
-    combined_path = f"{new_path}?{new_query}"
-    # create new simhash for path
-    new_simhash = Simhash(combined_path)
-    # adds new path to dictionary
-    simhash_dict[combined_path] = new_simhash
-    # checks current url simhash with existing simhash
-    for existing_path, existing_simhash in simhash_dict.items():
-        if combined_path == existing_path:
-            continue
-        # calculate Hamming distance between simhashes
-        distance = new_simhash.distance(existing_simhash)
-        # returns True if Hamming distance is 1 or less
-        if distance <= 1:
-            print(f"near duplicate detected, url: {url}")
-            return True
-    return False
 def generate_report():
-    # Number of unique pages
-    logger.info("Number of unique pages found: %s", len(unique_pages))
-
-    # Longest page
-    if page_lengths:
-        longest_page_url = max(page_lengths, key=page_lengths.get)
-        longest_page_length = page_lengths[longest_page_url]
-        logger.info("Longest page URL: %s, Length: %s", longest_page_url, longest_page_length)
-    else:
-        logger.info("No pages crawled yet.")
-
-    # # 50 most common words
-    # filtered_word_frequencies = {word: freq for word, freq in word_frequencies.items() if word not in stop_words}
-    # filtered_word_frequencies_counter = Counter(filtered_word_frequencies)
-    # common_words = filtered_word_frequencies_counter.most_common(50)
-    # logger.info("50 most common words:")
-    # for word, frequency in common_words:
-    #     logger.info("%s: %s", word, frequency)
-
-    # Subdomains count
-    logger.info("Subdomains count:")
-    for subdomain, count in sorted(subdomains.items()):
-        logger.info("%s: %s", subdomain, count)
-
-        # Count unique pages in each subdomain
-        subdomain_pages = [page for page in unique_pages if
-                           page.startswith("http://" + subdomain) or page.startswith("https://" + subdomain)]
-        logger.info("   %s, %s", subdomain, len(subdomain_pages))
\ No newline at end of file
+    # Unique pages, longest page, 50 most common words and subdomains
+    for line in analytics.report():
+        logger.info(line)
+
+    # Urls rejected by each is_valid rule
+    logger.info("Rejected urls per rule: %s", url_filter.report())
+
+    # Url templates the trap detector throttled or blocked
+    for line in trap_detector.report():
+        logger.info("Trap: %s", line)
@@ -1,25 +1,14 @@
-import os
-import logging
 from hashlib import sha256
 from urllib.parse import urlparse
 
+from utils.log import logs
+
+
 def get_logger(name, filename=None):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-    return logger
+    # Records go through a queue to one writer thread, which appends them to
+    # Logs/<filename or name>.log and the console. Calling this again for a
+    # name returns the same logger without adding handlers.
+    return logs.get_logger(name, filename)
 
 
 def get_urlhash(url):
@@ -0,0 +1,222 @@
+import os
+import glob
+import pickle
+from collections import Counter
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils.seen import UrlHashSet
+from utils.word_counts import ExactWordCounts
+
+# used until open() is given the configured word counts
+DEFAULT_WORD_COUNT_MEMORY = 64 * 2 ** 20
+
+
+class CrawlAnalytics(object):
+    ''' Report data, updated as pages arrive.
+
+    Every answer the report needs is maintained incrementally, except for
+    exact word counts that spilled to disk, which are merged when the report
+    is built. The state is checkpointed to a
+    file next to the frontier save file and can be read back at any time.
+
+    Pages added between checkpoints are appended to a journal,
+    <path>.journal.<generation>, as they arrive, like the frontier's saves.
+    A checkpoint of generation g holds every page journaled before it, so
+    open() replays the journals from g on and a crash loses no page the
+    frontier already counts as complete.
+    '''
+
+    def __init__(self, top_n=50):
+        self.top_n = top_n
+        self.unique_pages = UrlHashSet()
+        # pages crawled and unique pages per ics.uci.edu subdomain
+        self.subdomains = Counter()
+        self.subdomain_pages = Counter()
+        # pages crawled per host, for the frontier's priority function
+        self.hosts = Counter()
+        self.longest_page = (None, 0)
+        # spills to a temporary directory until open() puts it next to the
+        # checkpoint
+        self.words = ExactWordCounts(DEFAULT_WORD_COUNT_MEMORY, None)
+        self.lock = Lock()
+        self.path = None
+        self.generation = 0
+        self.journal = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        state["path"] = None
+        state["journal"] = None
+        return state
+
+    def __setstate__(self, state):
+        # checkpoints written before hosts were counted or journaled
+        self.hosts = Counter()
+        self.generation = 0
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def open(self, path, restart, words=None):
+        ''' Continues from the checkpoint at path, unless restarting. words
+        replaces the word counts of a fresh crawl, exact ones spilling to
+        <path>.words by default, a resumed crawl keeps the word counts of
+        its checkpoint. '''
+        if words is None and self.words.mode == "exact" and \
+                self.words.spill_dir is None:
+            words = ExactWordCounts(DEFAULT_WORD_COUNT_MEMORY, f"{path}.words")
+        if words is not None:
+            self.words = words
+        if restart:
+            for stale in [path] + self._journals(path) + self._sketches(path):
+                if os.path.exists(stale):
+                    os.remove(stale)
+        if os.path.exists(path):
+            state = self.load(path).__dict__
+            with self.lock:
+                self.__dict__.update(state)
+        self.words.loaded()
+        self.path = path
+        replayed = 0
+        for journal in self._journals(path):
+            if self._journal_generation(journal) < self.generation:
+                os.remove(journal)
+                continue
+            for page in self._read_journal(journal):
+                self._add_page(*page)
+                replayed += 1
+        with self.lock:
+            self._open_journal()
+        return replayed
+
+    @staticmethod
+    def _journals(path):
+        return sorted(glob.glob(f"{glob.escape(path)}.journal.*"),
+                      key=CrawlAnalytics._journal_generation)
+
+    @staticmethod
+    def _sketches(path):
+        # written by approximate word counts, see their checkpoint()
+        return glob.glob(f"{glob.escape(path)}.sketch.*")
+
+    @staticmethod
+    def _journal_generation(journal):
+        return int(journal.rpartition(".")[2])
+
+    @staticmethod
+    def _read_journal(journal):
+        with open(journal, "r+b") as f:
+            end = 0
+            while True:
+                try:
+                    page = pickle.load(f)
+                except Exception:
+                    # End of the journal, or a record cut short by a crash,
+                    # which can fail to load in many ways. It is cut off, so
+                    # pages appended to the journal later are readable.
+                    f.truncate(end)
+                    return
+                end = f.tell()
+                yield page
+
+    def _open_journal(self):
+        # called with the lock held
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(f"{self.path}.journal.{self.generation}", "ab")
+
+    def add_page(self, url, clean_url, subdomain, length, word_counts):
+        with self.lock:
+            self._add_page(url, clean_url, subdomain, length, word_counts)
+            if self.journal is not None:
+                pickle.dump((url, clean_url, subdomain, length, word_counts),
+                            self.journal, protocol=pickle.HIGHEST_PROTOCOL)
+                self.journal.flush()
+
+    def _add_page(self, url, clean_url, subdomain, length, word_counts):
+        # called with the lock held, or before the crawl starts
+        is_new_page = self.unique_pages.add(clean_url)
+        self.hosts[urlparse(url).netloc] += 1
+        if subdomain is not None:
+            self.subdomains[subdomain] += 1
+            if is_new_page:
+                self.subdomain_pages[subdomain] += 1
+        if length > self.longest_page[1]:
+            self.longest_page = (url, length)
+        self.words.update(word_counts)
+
+    def merge(self, other):
+        ''' Adds the report data of another crawl, like a shard of this one.
+        Shards crawl disjoint hosts, so their pages are disjoint too. '''
+        with self.lock:
+            self.unique_pages.update(other.unique_pages)
+            self.subdomains.update(other.subdomains)
+            self.subdomain_pages.update(other.subdomain_pages)
+            self.hosts.update(other.hosts)
+            if other.longest_page[1] > self.longest_page[1]:
+                self.longest_page = other.longest_page
+            self.words.merge(other.words)
+
+    def pages_of(self, host):
+        ''' Number of pages crawled from host. '''
+        return self.hosts[host]
+
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        with self.lock:
+            # pages added from now on go to the next generation's journal
+            self.generation += 1
+            write_words = self.words.checkpoint(
+                f"{path}.sketch.{self.generation}")
+            data = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+            unused_files = self.words.take_unused_files()
+            if self.journal is not None:
+                self._open_journal()
+        if write_words is not None:
+            write_words()
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        # the previous checkpoint may still have needed these
+        for unused_file in unused_files:
+            os.remove(unused_file)
+        for journal in self._journals(path):
+            if self._journal_generation(journal) < self.generation:
+                os.remove(journal)
+
+    def close(self):
+        ''' Writes a last checkpoint and closes the journal. '''
+        self.save()
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def report(self):
+        ''' Returns the report as a list of lines. '''
+        with self.lock:
+            lines = [f"Number of unique pages found: {len(self.unique_pages)}"]
+            url, length = self.longest_page
+            if url is None:
+                lines.append("No pages crawled yet.")
+            else:
+                lines.append(f"Longest page URL: {url}, Length: {length}")
+            lines.append(f"{self.top_n} most common words:")
+            for word, frequency in self.words.most_common(self.top_n):
+                lines.append(f"{word}: {frequency}")
+            lines.append(self.words.report())
+            lines.append("Subdomains count:")
+            for subdomain, count in sorted(self.subdomains.items()):
+                lines.append(f"{subdomain}: {count}")
+                lines.append(
+                    f"   {subdomain}, {self.subdomain_pages[subdomain]}")
+        return lines
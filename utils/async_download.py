@@ -0,0 +1,36 @@
+import aiohttp
+
+from utils.download import decode_response
+
+
+class AsyncDownloader(object):
+    ''' Pooled asyncio client for the cache server.
+
+    One keep-alive connection pool is shared by every fetch of the event
+    loop, with at most config.async_concurrency requests in flight and a
+    total timeout of config.download_timeout seconds per request.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self.session = None
+
+    async def __aenter__(self):
+        host, port = self.config.cache_server
+        self.base_url = f"http://{host}:{port}/"
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.config.async_concurrency),
+            timeout=aiohttp.ClientTimeout(
+                total=self.config.download_timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def download(self, url, logger=None):
+        async with self.session.get(
+                self.base_url,
+                params=[("q", url), ("u", self.config.user_agent)]) as resp:
+            content = await resp.read()
+        return decode_response(url, resp.status, content, logger)
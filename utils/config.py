@@ -8,12 +8,107 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.worker_model = config["LOCAL PROPERTIES"].get(
+            "WORKERMODEL", "thread").strip().lower()
+        self.async_concurrency = int(
+            config["LOCAL PROPERTIES"].get("ASYNCCONCURRENCY", 100))
+        self.parse_processes = int(
+            config["LOCAL PROPERTIES"].get("PARSEPROCESSES", 0))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.checkpoint_size = int(
+            config["LOCAL PROPERTIES"].get("CHECKPOINTSIZE", 1000))
+        self.checkpoint_interval = float(
+            config["LOCAL PROPERTIES"].get("CHECKPOINTINTERVAL", 10))
+        # Frontier snapshot for fast restarts, and whether workers start
+        # while its pending urls are still being loaded
+        self.snapshot = config["LOCAL PROPERTIES"].getboolean("SNAPSHOT", True)
+        self.snapshot_lazy = config["LOCAL PROPERTIES"].getboolean(
+            "SNAPSHOTLAZY", True)
+        self.seen_capacity = int(
+            config["LOCAL PROPERTIES"].get("SEENCAPACITY", 2000000))
+        self.seen_error_rate = float(
+            config["LOCAL PROPERTIES"].get("SEENERRORRATE", 0.001))
+        self.word_count_mode = config["LOCAL PROPERTIES"].get(
+            "WORDCOUNTMODE", "exact").strip().lower()
+        assert self.word_count_mode in ("exact", "approximate"), "WORDCOUNTMODE should be exact or approximate"
+        # In MiB in the config file
+        self.word_count_memory = int(float(
+            config["LOCAL PROPERTIES"].get("WORDCOUNTMEMORY", 64)) * 2 ** 20)
+
+        # Downloaded pages are stored, compressed, in <SAVE>.pages, in
+        # segments of PAGESTORESEGMENTSIZE MiB
+        self.page_store = None
+        if config["LOCAL PROPERTIES"].getboolean("PAGESTORE", True):
+            self.page_store = f"{self.save_file}.pages"
+        self.page_store_segment_size = int(float(config["LOCAL PROPERTIES"].get(
+            "PAGESTORESEGMENTSIZE", 256)) * 2 ** 20)
+        # Urls kept in memory per host, the rest of a host's queue waits in
+        # <SAVE>.queue
+        self.host_queue_memory = int(
+            config["LOCAL PROPERTIES"].get("HOSTQUEUEMEMORY", 64))
+
+        # Crawler processes, each crawling the hosts whose hash falls in its
+        # shard, and how links to another shard's hosts are forwarded.
+        self.shards = int(config["LOCAL PROPERTIES"].get("SHARDS", 1))
+        self.forward_batch_size = int(
+            config["LOCAL PROPERTIES"].get("FORWARDBATCHSIZE", 100))
+        self.forward_interval = float(
+            config["LOCAL PROPERTIES"].get("FORWARDINTERVAL", 1))
+
+        # Log files as text or JSON lines, and how per-url messages are
+        # thinned out: every LOGURLSAMPLE-th is kept, at most LOGURLRATE per
+        # second per logger (0 is no limit)
+        self.log_format = config["LOCAL PROPERTIES"].get(
+            "LOGFORMAT", "text").strip().lower()
+        assert self.log_format in ("text", "json"), "LOGFORMAT should be text or json"
+        self.log_url_sample = int(
+            config["LOCAL PROPERTIES"].get("LOGURLSAMPLE", 1))
+        self.log_url_rate = int(
+            config["LOCAL PROPERTIES"].get("LOGURLRATE", 0))
+
+        # Metrics snapshot written every METRICSINTERVAL seconds, and served
+        # on localhost if METRICSPORT is not 0
+        self.metrics_file = config["LOCAL PROPERTIES"].get(
+            "METRICSFILE", "Logs/metrics.json").strip()
+        self.metrics_interval = float(
+            config["LOCAL PROPERTIES"].get("METRICSINTERVAL", 10))
+        self.metrics_port = int(
+            config["LOCAL PROPERTIES"].get("METRICSPORT", 0))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        # In seconds, for a whole request to the cache server
+        self.download_timeout = float(
+            config["CONNECTION"].get("TIMEOUT", 30))
+        # In seconds, how long fetched and failed robots.txt lookups are kept
+        self.robots_ttl = float(config["CRAWLER"].get("ROBOTSTTL", 86400))
+        self.robots_failure_ttl = float(
+            config["CRAWLER"].get("ROBOTSFAILURETTL", 600))
+        # Url templates whose pages stop yielding new content and links are
+        # throttled, then blocked
+        self.trap_min_pages = int(config["CRAWLER"].get("TRAPMINPAGES", 20))
+        self.trap_throttle_yield = float(
+            config["CRAWLER"].get("TRAPTHROTTLEYIELD", 0.2))
+        self.trap_block_yield = float(
+            config["CRAWLER"].get("TRAPBLOCKYIELD", 0.05))
+        self.trap_throttle_rate = int(
+            config["CRAWLER"].get("TRAPTHROTTLERATE", 10))
+        # Failed downloads are retried with exponential backoff, in seconds,
+        # and hosts that keep failing are paused by a circuit breaker
+        self.max_retries = int(config["CRAWLER"].get("MAXRETRIES", 6))
+        self.retry_base_delay = float(
+            config["CRAWLER"].get("RETRYBASEDELAY", 10))
+        self.retry_max_delay = float(
+            config["CRAWLER"].get("RETRYMAXDELAY", 600))
+        self.breaker_threshold = int(
+            config["CRAWLER"].get("BREAKERTHRESHOLD", 5))
+        self.breaker_cooldown = float(
+            config["CRAWLER"].get("BREAKERCOOLDOWN", 60))
+        # Dotted path of the function that scores urls, best crawled first
+        self.priority = config["CRAWLER"].get(
+            "PRIORITY", "crawler.priority.default_score").strip()
 
         self.cache_server = None
\ No newline at end of file
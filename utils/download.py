@@ -1,21 +1,40 @@
 import requests
 import cbor
 import time
+import threading
 
 from utils.response import Response
 
+# one keep-alive session to the cache server per worker thread
+_local = threading.local()
+
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
 def download(url, config, logger=None):
     host, port = config.cache_server
-    resp = requests.get(
+    resp = get_session().get(
         f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+        timeout=config.download_timeout)
+    return decode_response(url, resp.status_code, resp.content, logger)
+
+
+def decode_response(url, status_code, content, logger=None):
+    ''' Decodes a cache server reply into a Response. '''
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if status_code < 400 and content:
+            return Response(cbor.loads(content))
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error <Response [{status_code}]> with url {url}.")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
+        "error": f"Spacetime Response error <Response [{status_code}]> with url {url}.",
+        "status": status_code,
         "url": url})
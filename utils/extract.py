@@ -0,0 +1,94 @@
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.dammit import UnicodeDammit
+
+# text inside these elements is not page text, matching BeautifulSoup's
+# get_text()
+SKIPPED_TEXT_TAGS = frozenset(["script", "style", "template"])
+# whitespace-only text is collapsed to one character outside these
+PRESERVE_WHITESPACE_TAGS = frozenset(["pre", "textarea"])
+ASCII_SPACES = " \n\t\x0c\r"
+
+
+class PageExtractor(HTMLParser):
+    ''' Streaming extraction of page text and links.
+
+    One pass over the document collects what the scraper needs from a
+    BeautifulSoup tree: the text of get_text(), the length of
+    get_text(strip=True), and the hrefs of <a> tags and of <link> tags
+    without a rel or with rel="stylesheet", in document order.
+    '''
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text = []
+        self.stripped_length = 0
+        self.hrefs = []
+        self.skip_depth = 0
+        self.preserve_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TEXT_TAGS:
+            self.skip_depth += 1
+        elif tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+        elif tag == "a" or tag == "link":
+            href = rel = None
+            # the last of repeated attributes wins, like in BeautifulSoup
+            for name, value in attrs:
+                if name == "href":
+                    href = value
+                elif name == "rel":
+                    rel = value
+            if tag == "link" and rel and "stylesheet" not in rel.split():
+                return
+            if href:
+                self.hrefs.append(href)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag not in SKIPPED_TEXT_TAGS and tag not in PRESERVE_WHITESPACE_TAGS:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TEXT_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag in PRESERVE_WHITESPACE_TAGS and self.preserve_depth:
+            self.preserve_depth -= 1
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if not self.preserve_depth and not data.strip(ASCII_SPACES):
+            # BeautifulSoup keeps whitespace between tags as one character
+            data = "\n" if "\n" in data else " "
+        self.text.append(data)
+        self.stripped_length += len(data.strip())
+
+    def unknown_decl(self, data):
+        if data.startswith("CDATA[") and not self.skip_depth:
+            self.handle_data(data[6:])
+
+
+def extract(content):
+    ''' Returns (text, stripped text length, hrefs) of an html document. '''
+    extractor = PageExtractor()
+    extractor.feed(UnicodeDammit(content, is_html=True).unicode_markup or "")
+    extractor.close()
+    return "".join(extractor.text), extractor.stripped_length, extractor.hrefs
+
+
+def extract_bs4(content):
+    ''' Same as extract, through a full BeautifulSoup tree. Kept as the
+    reference the streaming path is benchmarked and checked against. '''
+    soup = BeautifulSoup(content, 'html.parser')
+    hrefs = []
+    for link in soup.find_all(['a', 'link']):
+        href = link.get('href')
+        if link.name == 'link':
+            rel = link.get('rel')
+            if rel and 'stylesheet' not in rel:
+                continue
+        if href:
+            hrefs.append(href)
+    return soup.get_text(), len(soup.get_text(strip=True)), hrefs
@@ -0,0 +1,97 @@
+import os
+import struct
+from hashlib import blake2b
+from threading import Lock
+
+from simhash import Simhash
+
+from utils.simhash_index import SimhashIndex
+
+# (exact hash, simhash) per page, as two unsigned 64-bit integers
+RECORD = struct.Struct("<QQ")
+
+
+class ExactFingerprint(object):
+    ''' 64-bit hash of a page's words in order, fed one word at a time. '''
+
+    def __init__(self):
+        self.hash = blake2b(digest_size=8)
+        self.separator = b""
+
+    def update(self, word):
+        self.hash.update(self.separator + word.encode("utf-8"))
+        self.separator = b" "
+
+    def value(self):
+        return int.from_bytes(self.hash.digest(), "little")
+
+
+# simhash keeps per-feature weights in 8 bits
+MAX_WEIGHT = 255
+
+
+def content_simhash(word_counts):
+    # token-weighted: every distinct word is a feature weighted by its count
+    return Simhash([
+        (word, min(count, MAX_WEIGHT))
+        for word, count in word_counts.items()]).value
+
+
+class PageFingerprints(object):
+    ''' Exact and near-duplicate memory of page contents.
+
+    Fingerprints are appended to a small binary file next to the frontier
+    save file, so a resumed crawl keeps its dedup memory.
+    '''
+
+    def __init__(self, k=3):
+        self.exact = set()
+        self.near = SimhashIndex(k=k)
+        self.lock = Lock()
+        self.path = None
+        self.file = None
+
+    def open(self, path, restart):
+        ''' Loads fingerprints saved at path and appends new ones to it. '''
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            # cut off a trailing partial record from an interrupted write,
+            # so the records appended from now on stay aligned
+            usable = len(data) - len(data) % RECORD.size
+            if usable < len(data):
+                os.truncate(path, usable)
+            records = list(RECORD.iter_unpack(data[:usable]))
+            self.exact.update(exact for exact, _ in records)
+            self.near.add_many(near for _, near in records)
+        self.path = path
+        self.file = open(path, "ab")
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def add_fingerprints(self, exact, near):
+        ''' Records the page with the given exact hash and simhash and
+        returns True, or returns False if the page is an exact or near
+        duplicate of one already seen. '''
+        with self.lock:
+            if exact in self.exact:
+                return False
+        # An exact duplicate is also within distance 0 of the page's simhash,
+        # so of two threads adding the same page only one gets past this.
+        if not self.near.add_if_unique(near):
+            return False
+        # Only now, so the exact hashes in memory are the ones in the file.
+        with self.lock:
+            self.exact.add(exact)
+            if self.file:
+                self.file.write(RECORD.pack(exact, near))
+                self.file.flush()
+        return True
+
+    def __len__(self):
+        return len(self.exact)
@@ -0,0 +1,155 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from threading import Lock
+
+LOG_DIR = "Logs"
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    ''' One JSON object per line, with the url of per-url messages as a
+    field of its own. '''
+
+    def format(self, record):
+        entry = {
+            "time": record.created, "logger": record.name,
+            "level": record.levelname, "thread": record.threadName,
+            "message": record.getMessage()}
+        url = getattr(record, "url", None)
+        if url is not None:
+            entry["url"] = url
+        return json.dumps(entry)
+
+
+class FileRouter(logging.Handler):
+    ''' Writes each record to the log file of its logger, opening each file
+    once. Only called from the listener thread. '''
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        # logger name -> file name, and file name -> handler
+        self.files = dict()
+        self.handlers = dict()
+
+    def emit(self, record):
+        filename = self.files.get(record.name, record.name)
+        handler = self.handlers.get(filename)
+        if handler is None:
+            handler = self.handlers[filename] = logging.FileHandler(
+                os.path.join(LOG_DIR, f"{filename}.log"))
+            handler.setFormatter(self.formatter)
+        handler.emit(record)
+
+    def setFormatter(self, formatter):
+        super().setFormatter(formatter)
+        for handler in self.handlers.values():
+            handler.setFormatter(formatter)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+
+class UrlRecordFilter(logging.Filter):
+    ''' Thins out per-url records, those logged with extra={"url": url}:
+    keeps every sample-th of them, and at most rate per second per logger
+    (0 is no limit). Warnings and errors always pass. Runs in the thread
+    that logs, so dropped records never reach the queue. '''
+
+    def __init__(self, sample=1, rate=0):
+        super().__init__()
+        self.sample = sample
+        self.rate = rate
+        self.lock = Lock()
+        self.seen = 0
+        self.dropped = 0
+        # logger name -> (second, records passed in it)
+        self.windows = dict()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not hasattr(record, "url"):
+            return True
+        with self.lock:
+            self.seen += 1
+            keep = self.seen % self.sample == 0
+            if keep and self.rate:
+                second = int(record.created)
+                start, passed = self.windows.get(record.name, (second, 0))
+                if start != second:
+                    passed = 0
+                keep = passed < self.rate
+                self.windows[record.name] = (second, passed + keep)
+            if not keep:
+                self.dropped += 1
+            return keep
+
+
+class LogSystem(object):
+    ''' Loggers of the crawler. Records are put on a queue by the thread that
+    logs them, and a single listener thread formats them and writes them to
+    Logs/<file>.log and the console, so no worker waits for a disk or
+    terminal write, and lines of different threads never interleave. '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.queue = queue.SimpleQueue()
+        self.router = FileRouter()
+        self.console = logging.StreamHandler()
+        self.console.setLevel(logging.INFO)
+        self.url_filter = UrlRecordFilter()
+        self.handler = logging.handlers.QueueHandler(self.queue)
+        self.handler.addFilter(self.url_filter)
+        self.listener = None
+        self.set_format("text")
+
+    def set_format(self, log_format):
+        ''' text, or json for JSON lines in the log files. The console
+        stays text. '''
+        text = logging.Formatter(TEXT_FORMAT)
+        self.console.setFormatter(text)
+        self.router.setFormatter(
+            JsonFormatter() if log_format == "json" else text)
+
+    def get_logger(self, name, filename=None):
+        logger = logging.getLogger(name)
+        with self.lock:
+            if self.listener is None:
+                os.makedirs(LOG_DIR, exist_ok=True)
+                self.listener = logging.handlers.QueueListener(
+                    self.queue, self.router, self.console,
+                    respect_handler_level=True)
+                self.listener.start()
+                atexit.register(self.stop)
+            self.router.files[name] = filename or name
+            if self.handler not in logger.handlers:
+                logger.setLevel(logging.INFO)
+                logger.addHandler(self.handler)
+        return logger
+
+    def stop(self):
+        ''' Writes out the queued records and stops the listener. '''
+        if self.listener is None:
+            return
+        if self.url_filter.dropped:
+            self.get_logger("CRAWLER").info(
+                f"{self.url_filter.dropped} of {self.url_filter.seen} "
+                f"per-url log records were sampled out.")
+        with self.lock:
+            listener, self.listener = self.listener, None
+        listener.stop()
+        self.router.close()
+
+
+logs = LogSystem()
+
+
+def configure_logging(config):
+    ''' Applies the LOGFORMAT, LOGURLSAMPLE and LOGURLRATE settings. '''
+    logs.set_format(config.log_format)
+    logs.url_filter.sample = config.log_url_sample
+    logs.url_filter.rate = config.log_url_rate
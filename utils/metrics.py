@@ -0,0 +1,184 @@
+import os
+import json
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Event, Lock
+
+from utils import get_logger
+
+# upper bounds of the latency histogram buckets, in seconds, doubling from
+# 100us to about 105s; slower observations go to a last, unbounded bucket
+BUCKET_BOUNDS = tuple(0.0001 * 2 ** i for i in range(21))
+
+
+class Histogram(object):
+    ''' Latency distribution over fixed, log-spaced buckets. '''
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 6),
+            "p90": round(self.quantile(0.9), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Metrics(object):
+    ''' Counters, per-stage latency histograms and per-worker busy time.
+
+    Recording is a dict lookup and a few additions under one lock, cheap
+    enough for every url and every stage of a page.
+    '''
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = Counter()
+        self.histograms = dict()
+        self.busy = Counter()
+        self.lock = Lock()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def add_counts(self, counts, prefix=""):
+        with self.lock:
+            for name, amount in counts.items():
+                self.counters[f"{prefix}{name}"] += amount
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_all(self, timings):
+        ''' Records a dict of stage -> seconds, as collected in a PageRecord. '''
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def add_busy(self, worker, seconds):
+        with self.lock:
+            self.busy[worker] += seconds
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.time() - self.started
+            return {
+                "time": time.time(),
+                "elapsed": round(elapsed, 3),
+                "counters": dict(self.counters),
+                "stages": {stage: histogram.snapshot()
+                           for stage, histogram in sorted(self.histograms.items())},
+                # fraction of the time each worker spent processing urls,
+                # the rest went to waiting on the frontier
+                "utilization": {str(worker): round(busy / elapsed, 4)
+                                for worker, busy in sorted(self.busy.items())},
+            }
+
+
+# metrics of this process, shared by the workers, scraper and frontier
+metrics = Metrics()
+
+
+class MetricsExporter(Thread):
+    ''' Writes a metrics snapshot as JSON to config.metrics_file every
+    config.metrics_interval seconds and, if config.metrics_port is set,
+    serves the current snapshot on http://127.0.0.1:<port>/. '''
+
+    def __init__(self, config, metrics=metrics):
+        self.logger = get_logger("METRICS")
+        self.config = config
+        self.metrics = metrics
+        self.stopped = Event()
+        self.server = None
+        if config.metrics_port:
+            self.server = ThreadingHTTPServer(
+                ("127.0.0.1", config.metrics_port), self._make_handler())
+            self.server.daemon_threads = True
+            Thread(target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(
+                f"Serving metrics on http://127.0.0.1:{config.metrics_port}/")
+        super().__init__(daemon=True)
+
+    def _make_handler(self):
+        metrics = self.metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(metrics.snapshot()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
+    def export(self):
+        if not self.config.metrics_file:
+            return
+        tmp = f"{self.config.metrics_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.metrics.snapshot(), f, indent=1)
+        os.replace(tmp, self.config.metrics_file)
+
+    def run(self):
+        while not self.stopped.wait(self.config.metrics_interval):
+            try:
+                self.export()
+            except OSError as e:
+                self.logger.warning(f"Failed to export metrics: {e}")
+
+    def stop(self):
+        ''' Stops exporting, after writing one last snapshot. '''
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        self.export()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
@@ -1,14 +1,61 @@
 import pickle
 
 class Response(object):
+    ''' A reply of the cache server.
+
+    url, status and error are decoded right away. The pickled
+    requests.Response is only unpickled when raw_response, content or body
+    is first used, so replies that are never scraped cost no more than
+    their serialized bytes, and release() drops the page once it has been
+    scraped.
+    '''
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self._pickled = resp_dict.get("response")
+        self._raw_response = None
+        # bytes of the serialized response, known without decoding it
+        self.size = len(self._pickled) if isinstance(
+            self._pickled, (bytes, bytearray)) else 0
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            try:
+                self._raw_response = pickle.loads(self._pickled)
+            except TypeError:
+                self._raw_response = None
+            self._pickled = None
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, raw_response):
+        self._pickled = None
+        self._raw_response = raw_response
+
+    @property
+    def pickled(self):
+        ''' The serialized requests.Response while it is not decoded yet,
+        else None. '''
+        if isinstance(self._pickled, (bytes, bytearray)):
+            return self._pickled
+        return None
+
+    @property
+    def content(self):
+        ''' The page body as bytes, or None. '''
+        raw_response = self.raw_response
+        return raw_response.content if raw_response is not None else None
+
+    @property
+    def body(self):
+        ''' The page body as a memoryview of content, without a copy. '''
+        content = self.content
+        return memoryview(content) if content is not None else None
+
+    def release(self):
+        ''' Drops the page, decoded or not. '''
+        self._pickled = None
+        self._raw_response = None
@@ -0,0 +1,241 @@
+import math
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+from itertools import chain
+from threading import Lock
+
+
+def url_hash64(url):
+    ''' Non-zero 64-bit hash of a url string. '''
+    return int.from_bytes(
+        blake2b(url.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def urlhash_key(urlhash):
+    ''' 64-bit key of a hex digest such as get_urlhash. '''
+    return int(urlhash[:16], 16)
+
+
+class BloomFilter(object):
+    ''' Fixed-size Bloom filter over hex digests such as get_urlhash. '''
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(
+            self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, hexdigest):
+        # double hashing from two independent 64-bit slices of the digest
+        h1 = int(hexdigest[:16], 16)
+        h2 = int(hexdigest[16:32], 16) | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, hexdigest):
+        for pos in self._positions(hexdigest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, hexdigest):
+        bits = self.bits
+        return all(
+            bits[pos >> 3] & (1 << (pos & 7))
+            for pos in self._positions(hexdigest))
+
+    def expected_error_rate(self):
+        ''' False positive rate at the current number of items. '''
+        return (1 - math.exp(
+            -self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self.bits.__sizeof__()
+
+
+class SeenUrls(object):
+    ''' Two layer "have we seen this url hash" check.
+
+    The Bloom filter answers most misses from memory. Only when it reports a
+    possible hit is the persistent store consulted, which tells true hits
+    apart from false positives, unless the hash is in the optional index.
+    '''
+
+    def __init__(self, store, capacity=2000000, error_rate=0.001, index=None):
+        self.store = store
+        # optional set of hashes known to be in the store, checked first
+        self.index = index
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.lock = Lock()
+        self.store_lookups = 0
+        self.false_positives = 0
+
+    def load(self, urlhash):
+        ''' Registers a hash that is already in the store. '''
+        self.bloom.add(urlhash)
+
+    def restore(self, bits, count):
+        ''' Sets the Bloom filter to bits saved from one of the same size.
+        Returns False if the size differs. '''
+        if len(bits) != len(self.bloom.bits):
+            return False
+        with self.lock:
+            self.bloom.bits = bytearray(bits)
+            self.bloom.count = count
+        return True
+
+    def _in_store(self, urlhash):
+        self.store_lookups += 1
+        if self.index is not None and urlhash in self.index:
+            return True
+        if urlhash in self.store:
+            return True
+        self.false_positives += 1
+        return False
+
+    def add(self, urlhash, record):
+        ''' Puts the record in the store and returns True if the hash was
+        not seen before. '''
+        with self.lock:
+            if urlhash in self.bloom and self._in_store(urlhash):
+                return False
+            self.bloom.add(urlhash)
+            self.store.put(urlhash, record)
+            return True
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return urlhash in self.bloom and self._in_store(urlhash)
+
+    def __len__(self):
+        return self.bloom.count
+
+    def report(self):
+        observed = (self.false_positives / self.store_lookups
+                    if self.store_lookups else 0)
+        return (
+            f"Seen urls: {self.bloom.count} in a "
+            f"{self.bloom.__sizeof__() / 2 ** 20:.1f} MiB Bloom filter "
+            f"({self.bloom.num_bits} bits, {self.bloom.num_hashes} hashes, "
+            f"sized for {self.bloom.capacity}). "
+            f"Expected false positive rate {self.bloom.expected_error_rate():.5f}, "
+            f"{self.false_positives} false positives in "
+            f"{self.store_lookups} store lookups ({observed:.5f}).")
+
+
+class UrlHashSet(object):
+    ''' Set of urls stored as 64-bit hashes in one open-addressing array,
+    8 bytes per slot instead of a full url string per entry. '''
+
+    def __init__(self, capacity=1024):
+        size = 1
+        while size < capacity * 2:
+            size <<= 1
+        self.table = array("Q", bytes(8 * size))
+        self.mask = size - 1
+        self.count = 0
+        self.lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def _slot(self, table, mask, key):
+        i = key & mask
+        while table[i] and table[i] != key:
+            i = (i + 1) & mask
+        return i
+
+    def _grow(self):
+        old = self.table
+        self.table = array("Q", bytes(16 * len(old)))
+        self.mask = len(self.table) - 1
+        for key in old:
+            if key:
+                self.table[self._slot(self.table, self.mask, key)] = key
+
+    def _add_key(self, key):
+        i = self._slot(self.table, self.mask, key)
+        if self.table[i]:
+            return False
+        self.table[i] = key
+        self.count += 1
+        if self.count * 2 > len(self.table):
+            self._grow()
+        return True
+
+    def add(self, url):
+        ''' Adds the url, returns True if it was not in the set. '''
+        key = url_hash64(url)
+        with self.lock:
+            return self._add_key(key)
+
+    def update(self, other):
+        ''' Adds every url of another UrlHashSet. '''
+        with self.lock:
+            for key in other.table:
+                if key:
+                    self._add_key(key)
+
+    def __contains__(self, url):
+        key = url_hash64(url)
+        with self.lock:
+            return bool(self.table[self._slot(self.table, self.mask, key)])
+
+    def __len__(self):
+        return self.count
+
+
+class CompletedIndex(object):
+    ''' Set of url hashes, as 64-bit keys: one sorted array, which can be a
+    memoryview of a memory-mapped snapshot, plus a set of keys added since.
+    Lookups are a binary search, merge() folds the added keys into a new
+    sorted array. '''
+
+    def __init__(self, base=None):
+        self.base = array("Q") if base is None else base
+        self.added = set()
+        self.lock = Lock()
+
+    def add(self, urlhash):
+        key = urlhash_key(urlhash)
+        with self.lock:
+            self.added.add(key)
+
+    def _in_base(self, base, key):
+        i = bisect_left(base, key)
+        return i < len(base) and base[i] == key
+
+    def __contains__(self, urlhash):
+        key = urlhash_key(urlhash)
+        with self.lock:
+            if key in self.added:
+                return True
+            base = self.base
+        return self._in_base(base, key)
+
+    def merge(self):
+        ''' Returns all keys as one sorted array, which becomes the base. '''
+        with self.lock:
+            base = self.base
+            added = set(self.added)
+        new = sorted(key for key in added if not self._in_base(base, key))
+        if new:
+            # two sorted runs, which sorted merges in linear time
+            base = array("Q", sorted(chain(base, new)))
+        with self.lock:
+            self.base = base
+            self.added -= added
+        return base
+
+    def __len__(self):
+        with self.lock:
+            return len(self.base) + len(self.added)
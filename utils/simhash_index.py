@@ -0,0 +1,180 @@
+from array import array
+from bisect import bisect_left, insort
+from itertools import accumulate
+from threading import Lock
+
+FINGERPRINT_BITS = 64
+# new fingerprints wait in a small sorted buffer per table, merged into the
+# main array once the buffer holds this many or sqrt(stored), if larger
+MIN_BUFFER = 1024
+# each table has a directory of where the values starting with each value
+# of this many bits begin, so a lookup only bisects within one of them
+DIRECTORY_BITS = 16
+
+
+class SimhashIndex(object):
+    ''' Multi-table index over 64-bit simhash fingerprints.
+
+    The fingerprint is split into k + 1 bit blocks. Two fingerprints within
+    Hamming distance k must agree exactly on at least one block (pigeonhole),
+    so every block gets its own table. A table is one sorted array("Q") of
+    the fingerprints rotated so that its block comes first: the fingerprints
+    sharing a block value are a contiguous range, found by bisection. A
+    rotation does not change Hamming distances, so candidates are compared
+    as they are stored. That costs 8 * (k + 1) bytes per fingerprint.
+
+    Inserting into a sorted array moves everything after the insertion
+    point, so new fingerprints go to a small sorted buffer per table first,
+    which is merged into the main array in one pass when it fills up. A
+    directory of 2 ** DIRECTORY_BITS offsets per table, a fixed 256 KiB,
+    narrows the bisection down to values with the same leading bits.
+    '''
+
+    def __init__(self, k=1, bits=FINGERPRINT_BITS):
+        self.k = k
+        self.bits = bits
+        self.full_mask = (1 << bits) - 1
+        self.blocks = self._make_blocks(bits, k + 1)
+        # left rotation that moves each block to the most significant bits
+        self.rotations = [(bits - shift - width) % bits
+                          for shift, width in self.blocks]
+        # bits below the block once rotated
+        self.low_bits = [bits - width for _, width in self.blocks]
+        # per table: sorted rotated fingerprints, and the buffer of new ones
+        self.tables = [array("Q") for _ in self.blocks]
+        self.buffers = [array("Q") for _ in self.blocks]
+        # per table: number of values per leading bits, and where they start
+        self.directory_bits = min(
+            [DIRECTORY_BITS] + [width for _, width in self.blocks])
+        self.directory_shift = bits - self.directory_bits
+        self.counts = [array("I", bytes(4 << self.directory_bits))
+                       for _ in self.blocks]
+        self.offsets = [array("I", bytes(4 << self.directory_bits)) +
+                        array("I", [0]) for _ in self.blocks]
+        self.count = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def _make_blocks(bits, num_blocks):
+        # (shift, width) pairs covering all bits, as evenly as possible.
+        blocks = []
+        start = 0
+        for i in range(num_blocks):
+            width = bits // num_blocks + (1 if i < bits % num_blocks else 0)
+            blocks.append((start, width))
+            start += width
+        return blocks
+
+    def _rotate(self, value, left):
+        return ((value << left) | (value >> (self.bits - left))) \
+            & self.full_mask
+
+    def _keys(self, fingerprint):
+        return [self._rotate(fingerprint, left) for left in self.rotations]
+
+    def _find(self, keys):
+        k = self.k
+        shift = self.directory_shift
+        for i, key in enumerate(keys):
+            # the stored values with the same block as key, in the table
+            # within the run of the directory, and in the buffer
+            low_bits = self.low_bits[i]
+            start = key >> low_bits << low_bits
+            end = start + (1 << low_bits)
+            table = self.tables[i]
+            offsets = self.offsets[i]
+            top = key >> shift
+            high = offsets[top + 1]
+            first = bisect_left(table, start, offsets[top], high)
+            candidates = table[first:bisect_left(table, end, first, high)]
+            buffer = self.buffers[i]
+            if buffer:
+                first = bisect_left(buffer, start)
+                candidates += buffer[first:bisect_left(buffer, end, first)]
+            for candidate in candidates:
+                if bin(candidate ^ key).count("1") <= k:
+                    # rotated back to the fingerprint that was added
+                    return self._rotate(candidate, self.bits - self.rotations[i])
+        return None
+
+    def _index(self, i, values):
+        # counts the new values of table i and recomputes where each run of
+        # leading bits starts
+        counts = self.counts[i]
+        for value in values:
+            counts[value >> self.directory_shift] += 1
+        self.offsets[i] = array("I", accumulate(counts, initial=0))
+
+    @staticmethod
+    def _merge(table, buffer):
+        # one pass over the table, copying the runs between buffered values
+        merged = array("Q")
+        previous = 0
+        for value in buffer:
+            position = bisect_left(table, value, previous)
+            merged.extend(table[previous:position])
+            merged.append(value)
+            previous = position
+        merged.extend(table[previous:])
+        return merged
+
+    def _insert(self, keys):
+        limit = max(MIN_BUFFER, int(self.count ** 0.5))
+        for i, key in enumerate(keys):
+            buffer = self.buffers[i]
+            insort(buffer, key)
+            if len(buffer) >= limit:
+                self.tables[i] = self._merge(self.tables[i], buffer)
+                self._index(i, buffer)
+                self.buffers[i] = array("Q")
+        self.count += 1
+
+    def find_near(self, fingerprint):
+        ''' Returns a stored fingerprint within distance k, or None. '''
+        with self.lock:
+            return self._find(self._keys(fingerprint))
+
+    def contains_near(self, fingerprint):
+        return self.find_near(fingerprint) is not None
+
+    def add(self, fingerprint):
+        with self.lock:
+            self._insert(self._keys(fingerprint))
+
+    def add_many(self, fingerprints):
+        ''' Adds fingerprints without checking them, sorting each table
+        once, for loading saved ones. '''
+        fingerprints = list(fingerprints)
+        with self.lock:
+            for i, left in enumerate(self.rotations):
+                keys = [self._rotate(fingerprint, left)
+                        for fingerprint in fingerprints]
+                self._index(i, keys)
+                self._index(i, self.buffers[i])
+                keys.extend(self.tables[i])
+                keys.extend(self.buffers[i])
+                self.tables[i] = array("Q", sorted(keys))
+                self.buffers[i] = array("Q")
+            self.count += len(fingerprints)
+
+    def add_if_unique(self, fingerprint):
+        ''' Inserts the fingerprint unless a near duplicate is already stored.
+
+        Returns True if it was inserted, False if it is a near duplicate.
+        The check and the insert happen under one lock, so a fingerprint is
+        never compared against itself and two threads cannot both insert the
+        same near duplicate.
+        '''
+        keys = self._keys(fingerprint)
+        with self.lock:
+            if self._find(keys) is not None:
+                return False
+            self._insert(keys)
+            return True
+
+    def __len__(self):
+        return self.count
+
+    def __sizeof__(self):
+        return sum(stored.itemsize * len(stored) for stored in
+                   self.tables + self.buffers + self.counts + self.offsets)
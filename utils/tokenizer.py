@@ -0,0 +1,93 @@
+import re
+
+# nltk's English stopword list, bundled so nothing is downloaded at runtime
+STOP_WORDS = frozenset([
+    "i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you",
+    "you're", "you've", "you'll", "you'd", "your", "yours", "yourself",
+    "yourselves", "he", "him", "his", "himself", "she", "she's", "her", "hers",
+    "herself", "it", "it's", "its", "itself", "they", "them", "their",
+    "theirs", "themselves", "what", "which", "who", "whom", "this", "that",
+    "that'll", "these", "those", "am", "is", "are", "was", "were", "be",
+    "been", "being", "have", "has", "had", "having", "do", "does", "did",
+    "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as",
+    "until", "while", "of", "at", "by", "for", "with", "about", "against",
+    "between", "into", "through", "during", "before", "after", "above",
+    "below", "to", "from", "up", "down", "in", "out", "on", "off", "over",
+    "under", "again", "further", "then", "once", "here", "there", "when",
+    "where", "why", "how", "all", "any", "both", "each", "few", "more",
+    "most", "other", "some", "such", "no", "nor", "not", "only", "own",
+    "same", "so", "than", "too", "very", "s", "t", "can", "will", "just",
+    "don", "don't", "should", "should've", "now", "d", "ll", "m", "o", "re",
+    "ve", "y", "ain", "aren", "aren't", "couldn", "couldn't", "didn",
+    "didn't", "doesn", "doesn't", "hadn", "hadn't", "hasn", "hasn't",
+    "haven", "haven't", "isn", "isn't", "ma", "mightn", "mightn't", "mustn",
+    "mustn't", "needn", "needn't", "shan", "shan't", "shouldn", "shouldn't",
+    "wasn", "wasn't", "weren", "weren't", "won", "won't", "wouldn",
+    "wouldn't"])
+
+# Runs of the characters nltk's word tokenizer keeps together: word
+# characters, apostrophes and + - . / = \ ^ | ~ … ·
+TOKEN_RE = re.compile(r"[\w'+\-./=\\^|~…·]+")
+# ellipses, dashes and quotes nltk splits off as tokens of their own
+SEPARATOR_RE = re.compile(r"\.\.\.|--|''")
+# clitics and closing quotes split off the end of a token
+ENDING_RE = re.compile(r"(?i)(?<=[^'])(?:'s|'m|'d|'ll|'re|'ve|n't|')$")
+# whole words nltk splits in two, by the length of the first part
+SPLIT_WORDS = {
+    "cannot": 3, "gimme": 3, "gonna": 3, "gotta": 3, "lemme": 3, "wanna": 3}
+
+
+def _split(token):
+    split = SPLIT_WORDS.get(token.lower())
+    if split is None:
+        return (token,)
+    return token[:split], token[split:]
+
+
+def _alphabetic_parts(token):
+    # the slow path, for tokens that are not purely alphabetic
+    parts = []
+    for part in SEPARATOR_RE.split(token):
+        part = part.lstrip("'")
+        # a sentence final period, which punkt splits off
+        if part.endswith(".") and part.count(".") == 1:
+            part = part[:-1]
+        part = ENDING_RE.sub("", part)
+        if part.isalpha():
+            parts.extend(_split(part))
+    return parts
+
+
+def tokenize(text):
+    ''' The alphabetic tokens of text, as nltk.word_tokenize followed by
+    str.isalpha would give them.
+
+    A token is a run of the characters nltk keeps together, and only tokens
+    with anything besides letters take the slower path that splits off
+    clitics ("n't", "'s", ...), quotes, ellipses, "--" dashes and a sentence
+    final period. Unlike punkt it also splits the period off abbreviations
+    such as "Dr.".
+    '''
+    tokens = []
+    for token in TOKEN_RE.findall(text):
+        if not token.isalpha():
+            tokens.extend(_alphabetic_parts(token))
+        # only words of 5 or 6 letters can be in SPLIT_WORDS
+        elif 5 <= len(token) <= 6:
+            tokens.extend(_split(token))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def words(text, min_len=2, stop_words=STOP_WORDS):
+    ''' Lowercased alphabetic tokens of text of at least min_len letters
+    that are not stopwords. '''
+    return [word for word in (
+        token.lower() for token in tokenize(text) if len(token) >= min_len)
+        if word not in stop_words]
+
+
+def words_many(texts, min_len=2, stop_words=STOP_WORDS):
+    ''' words for each of texts. '''
+    return [words(text, min_len, stop_words) for text in texts]
@@ -0,0 +1,192 @@
+import os
+import re
+import pickle
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils import get_logger
+
+# path segments collapsed into a placeholder in url templates
+NUMBER_RE = re.compile(r"^\d+$")
+DATE_RE = re.compile(r"^\d{4}-\d{1,2}(-\d{1,2})?$")
+# long runs of hex digits, uuids, or words mixing letters and digits
+ID_RE = re.compile(r"^(?=.*\d)[0-9a-fA-F-]{8,}$|^(?=.*\d)(?=.*[a-zA-Z])[\w-]{12,}$")
+NUMBER_IN_SEGMENT_RE = re.compile(r"\d+")
+
+# weight of the newest page in a template's moving average yield
+YIELD_WEIGHT = 0.1
+
+OPEN, THROTTLED, BLOCKED = "open", "throttled", "blocked"
+
+
+def url_template(url):
+    ''' host/path of a url with numbers, dates and ids replaced by
+    placeholders, plus the sorted names of its query parameters. '''
+    parsed = urlparse(url)
+    segments = []
+    for segment in parsed.path.split("/"):
+        if NUMBER_RE.match(segment):
+            segment = "{n}"
+        elif DATE_RE.match(segment):
+            segment = "{date}"
+        elif ID_RE.match(segment):
+            segment = "{id}"
+        else:
+            segment = NUMBER_IN_SEGMENT_RE.sub("{n}", segment)
+        segments.append(segment)
+    template = f"{parsed.netloc}{'/'.join(segments)}"
+    if parsed.query:
+        names = sorted({pair.split("=", 1)[0] for pair in parsed.query.split("&")})
+        template += "?" + "&".join(names)
+    return template
+
+
+class TemplateStats(object):
+    __slots__ = ("admitted", "rejected", "pages", "new_pages", "links",
+                 "new_links", "yield_average", "state")
+
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.pages = 0
+        self.new_pages = 0
+        self.links = 0
+        self.new_links = 0
+        # starts optimistic, so a template is judged by its own pages
+        self.yield_average = 1.0
+        self.state = OPEN
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class TrapDetector(object):
+    ''' Learns which url templates are crawler traps from what their pages
+    yield.
+
+    Each fetched page yields 1/2 if its content was new plus 1/2 times the
+    fraction of its outlinks that were new. A template's yield is the moving
+    average over its pages. After min_pages pages, a template whose yield
+    drops below throttle_yield only gets every throttle_rate-th of its urls
+    admitted, and one below block_yield gets none. A throttled template
+    whose yield recovers is opened again. Every change of state is logged
+    with the numbers behind it.
+
+    Recording a page and admitting a url are a template computation and a
+    few dict updates, independent of how much was crawled.
+    '''
+
+    def __init__(self, min_pages=20, throttle_yield=0.2, block_yield=0.05,
+                 throttle_rate=10):
+        self.logger = get_logger("TRAPS")
+        self.min_pages = min_pages
+        self.throttle_yield = throttle_yield
+        self.block_yield = block_yield
+        self.throttle_rate = throttle_rate
+        self.templates = dict()
+        # host -> [pages, new pages]
+        self.hosts = dict()
+        self.lock = Lock()
+        self.path = None
+
+    def open(self, path, restart, config=None):
+        ''' Continues with the statistics saved at path, unless restarting. '''
+        if config is not None:
+            self.min_pages = config.trap_min_pages
+            self.throttle_yield = config.trap_throttle_yield
+            self.block_yield = config.trap_block_yield
+            self.throttle_rate = config.trap_throttle_rate
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self.templates, self.hosts = pickle.load(f)
+            self.logger.info(
+                f"Loaded statistics of {len(self.templates)} url templates.")
+        self.path = path
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            data = pickle.dumps((self.templates, self.hosts),
+                                protocol=pickle.HIGHEST_PROTOCOL)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def _stats(self, template):
+        stats = self.templates.get(template)
+        if stats is None:
+            stats = self.templates[template] = TemplateStats()
+        return stats
+
+    def admit(self, url):
+        ''' Returns False if url belongs to a blocked template, or is not
+        one of the sampled urls of a throttled template. '''
+        template = url_template(url)
+        with self.lock:
+            stats = self._stats(template)
+            if stats.state == BLOCKED:
+                admitted = False
+            elif stats.state == THROTTLED:
+                admitted = (stats.admitted + stats.rejected) % self.throttle_rate == 0
+            else:
+                admitted = True
+            if admitted:
+                stats.admitted += 1
+            else:
+                stats.rejected += 1
+        return admitted
+
+    def record_page(self, url, new_content, links, new_links):
+        ''' Records what a fetched page of url yielded: whether its content
+        was new, and how many of its outlinks were new. '''
+        template = url_template(url)
+        page_yield = 0.5 * bool(new_content) + (
+            0.5 * new_links / links if links else 0)
+        with self.lock:
+            stats = self._stats(template)
+            stats.pages += 1
+            stats.new_pages += bool(new_content)
+            stats.links += links
+            stats.new_links += new_links
+            stats.yield_average += YIELD_WEIGHT * (page_yield - stats.yield_average)
+            host = self.hosts.setdefault(urlparse(url).netloc, [0, 0])
+            host[0] += 1
+            host[1] += bool(new_content)
+            if stats.pages >= self.min_pages:
+                self._update_state(template, stats, host)
+
+    def _update_state(self, template, stats, host):
+        if stats.yield_average < self.block_yield:
+            state = BLOCKED
+        elif stats.yield_average < self.throttle_yield:
+            state = THROTTLED
+        else:
+            state = OPEN
+        # a blocked template gets no new pages to recover with, it stays
+        if state == stats.state or stats.state == BLOCKED:
+            return
+        stats.state = state
+        self.logger.warning(
+            f"Template {template} is now {state}: yield {stats.yield_average:.3f} "
+            f"(throttle below {self.throttle_yield}, block below "
+            f"{self.block_yield}), {stats.new_pages} of {stats.pages} pages "
+            f"had new content, {stats.new_links} of {stats.links} outlinks "
+            f"were new, {stats.admitted} urls admitted and {stats.rejected} "
+            f"rejected; host has {host[1]} new of {host[0]} pages.")
+
+    def report(self):
+        ''' One line per template that is not open. '''
+        with self.lock:
+            return [
+                f"{template}: {stats.state}, yield {stats.yield_average:.3f}, "
+                f"{stats.pages} pages, {stats.rejected} urls rejected"
+                for template, stats in sorted(self.templates.items())
+                if stats.state != OPEN]
@@ -0,0 +1,121 @@
+import re
+from collections import Counter
+from threading import Lock
+from urllib.parse import urlparse
+
+# uci websites to be crawled
+ALLOWED_DOMAINS = ("ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu")
+# hosts that end with an allowed domain but are not part of the crawl
+EXCLUDED_HOSTS = ("physics.uci.edu",)
+ALLOWED_SCHEMES = ("http", "https")
+# Trap checking for certain words in path and query
+QUERY_BLACKLIST = ("ical", "rev")
+PATH_BLACKLIST = ("/events/", "/day/", "/week/", "/month/", "/list/", "?filter", "img")
+MAX_URL_LENGTH = 200
+# Trap checking for slideshows and datasheets
+TRAP_PATTERNS = (r"[sS]li?de?s?[_-]?\d", r"sheets?-?\d")
+EXTENSIONS = (
+    "css|js|bmp|gif|jpe?g|ico"
+    "|png|tiff?|mid|mp2|mp3|mp4"
+    "|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+    "|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+    "|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+    "|epub|dll|cnf|tgz|sha1"
+    "|thmx|mso|arff|rtf|jar|csv"
+    "|rm|smil|wmv|swf|wma|zip|rar|gz")
+
+# rule names, in the order rules are checked
+RULES = ("domain", "scheme", "query_blacklist", "path_blacklist",
+         "repeated_segment", "length", "trap_pattern", "extension")
+
+
+def _any_substring(substrings):
+    # one alternation instead of a Python loop over the substrings
+    return re.compile("|".join(re.escape(s) for s in substrings))
+
+
+class UrlFilter(object):
+    ''' The scraper's url rules, compiled once.
+
+    check() returns the name of the first rule that rejects a url, or None.
+    Every rejection is counted per rule in hits.
+    '''
+
+    def __init__(self, allowed_domains=ALLOWED_DOMAINS,
+                 excluded_hosts=EXCLUDED_HOSTS, schemes=ALLOWED_SCHEMES,
+                 query_blacklist=QUERY_BLACKLIST, path_blacklist=PATH_BLACKLIST,
+                 max_length=MAX_URL_LENGTH, trap_patterns=TRAP_PATTERNS,
+                 extensions=EXTENSIONS):
+        self.allowed_domains = tuple(allowed_domains)
+        self.excluded_hosts = frozenset(excluded_hosts)
+        self.schemes = frozenset(schemes)
+        self.query_re = _any_substring(query_blacklist)
+        self.path_re = _any_substring(path_blacklist)
+        self.max_length = max_length
+        self.trap_re = re.compile("|".join(f"(?:{p})" for p in trap_patterns))
+        self.extension_re = re.compile(rf".*\.(?:{extensions})$")
+        self.hits = Counter()
+        self.lock = Lock()
+
+    def check(self, url):
+        parsed = urlparse(url)
+        netloc = parsed.netloc
+        if not netloc.endswith(self.allowed_domains) or netloc in self.excluded_hosts:
+            return "domain"
+        if parsed.scheme not in self.schemes:
+            return "scheme"
+        if self.query_re.search(parsed.query):
+            return "query_blacklist"
+        path = parsed.path.lower()
+        if self.path_re.search(path):
+            return "path_blacklist"
+        # Check if URL contains repeated words
+        segments = parsed.path.split("/")
+        if len(segments) != len(set(segments)):
+            return "repeated_segment"
+        if len(url) > self.max_length:
+            return "length"
+        if self.trap_re.search(url):
+            return "trap_pattern"
+        if self.extension_re.match(path):
+            return "extension"
+        return None
+
+    def is_valid(self, url):
+        rule = self.check(url)
+        if rule is None:
+            return True
+        with self.lock:
+            self.hits[rule] += 1
+        return False
+
+    def is_valid_many(self, urls, hits=None):
+        ''' is_valid for a whole list of urls, counting rejections into hits
+        (a Counter) if given, otherwise into self.hits. Repeated urls are
+        only checked once. '''
+        check = self.check
+        results = {}
+        batch_hits = Counter()
+        valid = []
+        for url in urls:
+            if url in results:
+                rule = results[url]
+            else:
+                rule = results[url] = check(url)
+            if rule is None:
+                valid.append(True)
+            else:
+                batch_hits[rule] += 1
+                valid.append(False)
+        if hits is None:
+            self.add_hits(batch_hits)
+        else:
+            hits.update(batch_hits)
+        return valid
+
+    def add_hits(self, hits):
+        with self.lock:
+            self.hits.update(hits)
+
+    def report(self):
+        return ", ".join(f"{rule}: {self.hits[rule]}" for rule in RULES)
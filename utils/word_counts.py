@@ -0,0 +1,319 @@
+import os
+import sys
+import heapq
+import hashlib
+import tempfile
+from array import array
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+# rows of the count-min sketch, each row halves the chance of a bad estimate
+SKETCH_DEPTH = 4
+# words tracked as heavy-hitter candidates per word of the report
+CANDIDATES_PER_TOP_WORD = 20
+# rough size of one entry of an in-memory Counter of short words
+COUNTER_ENTRY_BYTES = 120
+# sorted runs on disk are merged into one once there are this many
+MAX_RUNS = 16
+
+
+class TopWords(object):
+    ''' Exact top-n of counts that only ever grow, updated in O(1) for
+    the common case of a word that does not make the top, O(log n) else.
+
+    A min-heap of (count, word) finds the smallest count of the top. A word
+    whose count grows is pushed again rather than moved, so entries whose
+    count is no longer the word's are skipped when they reach the root, and
+    the heap is rebuilt from the top once they make up half of it.
+    '''
+
+    def __init__(self, n):
+        self.n = n
+        self.top = dict()
+        self.heap = list()
+
+    def __getstate__(self):
+        return {"n": self.n, "top": self.top}
+
+    def __setstate__(self, state):
+        self.n = state["n"]
+        self.top = state["top"]
+        self._rebuild()
+
+    def _rebuild(self):
+        self.heap = [(count, word) for word, count in self.top.items()]
+        heapq.heapify(self.heap)
+
+    def _min_count(self):
+        heap, top = self.heap, self.top
+        while top.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0]
+
+    def update(self, word, count):
+        top = self.top
+        if word not in top and len(top) >= self.n:
+            if count <= self._min_count():
+                return
+            del top[heapq.heappop(self.heap)[1]]
+        top[word] = count
+        heapq.heappush(self.heap, (count, word))
+        if len(self.heap) > 2 * self.n:
+            self._rebuild()
+
+    def most_common(self, n=None):
+        items = sorted(self.top.items(), key=lambda item: (-item[1], item[0]))
+        return items if n is None else items[:n]
+
+
+def _word_hashes(word):
+    # two independent 64 bit hashes, combined into one index per sketch row
+    digest = hashlib.blake2b(word.encode("utf-8"), digest_size=16).digest()
+    return (int.from_bytes(digest[:8], "little"),
+            int.from_bytes(digest[8:], "little") | 1)
+
+
+class ApproximateWordCounts(object):
+    ''' Word counts in fixed memory: a count-min sketch plus heavy hitters.
+
+    The sketch never underestimates a count, and with memory_bytes to spare
+    its estimate of a frequent word is off by a tiny fraction of all tokens.
+    The words with the highest estimates are tracked as candidates, so the
+    top of the report is answered without keeping the vocabulary.
+
+    The sketch is not pickled with the rest: checkpoint() writes its rows
+    to a file of their own, and only if they changed since the last one.
+    '''
+
+    mode = "approximate"
+
+    def __init__(self, memory_bytes, top_n=50, depth=SKETCH_DEPTH):
+        self.depth = depth
+        self.width = max(1024, memory_bytes // (8 * depth))
+        self.rows = [array("Q", bytes(8 * self.width)) for _ in range(depth)]
+        self.candidates = TopWords(top_n * CANDIDATES_PER_TOP_WORD)
+        self.total = 0
+        # the file with the rows of the last checkpoint, and whether the
+        # rows changed since
+        self.sketch_file = None
+        self.changed = True
+        self.unused_files = list()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["rows"]
+        state["unused_files"] = list()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rows = list()
+        with open(self.sketch_file, "rb") as f:
+            for _ in range(self.depth):
+                row = array("Q")
+                row.fromfile(f, self.width)
+                self.rows.append(row)
+        self.changed = False
+
+    def checkpoint(self, path):
+        ''' Copies the rows, if they changed, to be written to path by the
+        returned function before the checkpoint referring to them. '''
+        if not self.changed:
+            return None
+        rows = [array("Q", row) for row in self.rows]
+        if self.sketch_file is not None:
+            self.unused_files.append(self.sketch_file)
+        self.sketch_file = path
+        self.changed = False
+
+        def write():
+            try:
+                with open(f"{path}.tmp", "wb") as f:
+                    for row in rows:
+                        row.tofile(f)
+                os.replace(f"{path}.tmp", path)
+            except BaseException:
+                # written again by the next checkpoint
+                self.changed = True
+                raise
+        return write
+
+    def update(self, word_counts):
+        rows, width = self.rows, self.width
+        candidates = self.candidates
+        for word, count in word_counts.items():
+            h1, h2 = _word_hashes(word)
+            indexes = [(h1 + i * h2) % width for i in range(self.depth)]
+            # conservative update: only counters at the minimum grow, which
+            # keeps the overestimates of frequent words much smaller
+            estimate = min(row[index] for row, index in zip(rows, indexes)) + count
+            for row, index in zip(rows, indexes):
+                if row[index] < estimate:
+                    row[index] = estimate
+            candidates.update(word, estimate)
+            self.total += count
+        self.changed = True
+
+    def estimate(self, word):
+        h1, h2 = _word_hashes(word)
+        return min(row[(h1 + i * h2) % self.width]
+                   for i, row in enumerate(self.rows))
+
+    def merge(self, other):
+        ''' Adds the counts of a sketch of the same size. '''
+        assert (self.width, self.depth) == (other.width, other.depth), \
+            "Only sketches of the same size can be merged"
+        for row, other_row in zip(self.rows, other.rows):
+            for i, value in enumerate(other_row):
+                if value:
+                    row[i] += value
+        words = set(self.candidates.top) | set(other.candidates.top)
+        self.candidates = TopWords(self.candidates.n)
+        for word in words:
+            self.candidates.update(word, self.estimate(word))
+        self.total += other.total
+        self.changed = True
+
+    def most_common(self, n):
+        return self.candidates.most_common(n)
+
+    def memory_usage(self):
+        return (sum(row.itemsize * len(row) for row in self.rows)
+                + len(self.candidates.top) * COUNTER_ENTRY_BYTES)
+
+    def take_unused_files(self):
+        ''' Sketch files to remove once a checkpoint of this object is
+        written. '''
+        unused_files = self.unused_files
+        self.unused_files = list()
+        return unused_files
+
+    def loaded(self):
+        pass
+
+    def report(self):
+        # a frequent word's count is overestimated by at most this much,
+        # with probability 1 - 2 ** -depth
+        error = 2.718281828 * self.total / self.width
+        return (f"Word counts: approximate, {self.total} tokens, "
+                f"{self.memory_usage() / 2 ** 20:.1f} MiB, "
+                f"overestimate bound {error:.0f}")
+
+
+class ExactWordCounts(object):
+    ''' Exact word counts with bounded memory.
+
+    Counts are kept in a Counter until it holds about memory_bytes worth of
+    words, then written to spill_dir as a run sorted by word and cleared.
+    most_common merges the runs, so the full vocabulary is only ever on
+    disk. Once MAX_RUNS runs exist they are merged into one. Without a
+    spill_dir, runs go to a temporary directory.
+    '''
+
+    mode = "exact"
+
+    def __init__(self, memory_bytes, spill_dir):
+        self.max_words = max(1000, memory_bytes // COUNTER_ENTRY_BYTES)
+        self.spill_dir = spill_dir
+        self.counts = Counter()
+        self.runs = list()
+        # runs merged into another, removed once a checkpoint no longer
+        # refers to them
+        self.merged_runs = list()
+        self.next_run = 0
+        self.total = 0
+
+    def update(self, word_counts):
+        self.counts.update(word_counts)
+        self.total += sum(word_counts.values())
+        if len(self.counts) >= self.max_words:
+            self.spill()
+
+    def _write_run(self, items):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="word_counts.")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"run{self.next_run:06d}")
+        self.next_run += 1
+        with open(path, "w", encoding="utf-8") as f:
+            for word, count in items:
+                f.write(f"{word}\t{count}\n")
+        return path
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                word, count = line.rstrip("\n").split("\t")
+                yield word, int(count)
+
+    @staticmethod
+    def _merge(sources):
+        # sorted (word, count) sources -> (word, total count) in word order
+        for word, group in groupby(
+                heapq.merge(*sources, key=itemgetter(0)), key=itemgetter(0)):
+            yield word, sum(count for _, count in group)
+
+    def spill(self):
+        if not self.counts:
+            return
+        self.runs.append(self._write_run(sorted(self.counts.items())))
+        self.counts = Counter()
+        if len(self.runs) >= MAX_RUNS:
+            self.merged_runs.extend(self.runs)
+            self.runs = [self._write_run(
+                self._merge([self._read_run(path) for path in self.runs]))]
+
+    def merge(self, other):
+        ''' Adds the counts of another ExactWordCounts, copying its runs
+        into this one's spill_dir as one run. '''
+        if other.runs:
+            self.runs.append(self._write_run(
+                self._merge([self._read_run(path) for path in other.runs])))
+        self.total += other.total
+        self.counts.update(other.counts)
+        if len(self.counts) >= self.max_words:
+            self.spill()
+
+    def most_common(self, n):
+        sources = [self._read_run(path) for path in self.runs]
+        sources.append(sorted(self.counts.items()))
+        return heapq.nsmallest(
+            n, self._merge(sources), key=lambda item: (-item[1], item[0]))
+
+    def memory_usage(self):
+        return sys.getsizeof(self.counts) + len(self.counts) * COUNTER_ENTRY_BYTES
+
+    def report(self):
+        spilled = sum(os.path.getsize(path) for path in self.runs)
+        return (f"Word counts: exact, {self.total} tokens, "
+                f"{self.memory_usage() / 2 ** 20:.1f} MiB in memory, "
+                f"{len(self.runs)} runs and {spilled / 2 ** 20:.1f} MiB on disk")
+
+    def checkpoint(self, path):
+        # the runs are already on disk
+        return None
+
+    def take_unused_files(self):
+        ''' Runs to remove once a checkpoint of this object is written. '''
+        merged_runs = self.merged_runs
+        self.merged_runs = list()
+        return merged_runs
+
+    def loaded(self):
+        ''' Called after loading a checkpoint, removes runs written after it. '''
+        self.merged_runs = list()
+        if self.spill_dir is None or not os.path.isdir(self.spill_dir):
+            return
+        keep = set(self.runs)
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            if path not in keep:
+                os.remove(path)
+
+
+def make_word_counts(config, spill_dir, top_n=50):
+    if config.word_count_mode == "approximate":
+        return ApproximateWordCounts(config.word_count_memory, top_n)
+    return ExactWordCounts(config.word_count_memory, spill_dir)